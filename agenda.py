@@ -0,0 +1,100 @@
+import heapq
+from typing import Dict, List, Tuple, Any, Iterable, Optional
+
+from kb import Rule
+from engine import PROTECTED_KEYS, sort_rules
+
+
+class Agenda:
+    """Conflict-resolution agenda over indexes into a sorted rule list.
+
+    Replays the pass order of ``engine.forward_chain``: a rule activated ahead
+    of the scan cursor is fired later in the same pass, one activated behind it
+    waits for the next pass.
+    """
+
+    def __init__(self, activations: Iterable[int] = ()) -> None:
+        self._current: List[int] = sorted(set(activations))
+        self._queued = set(self._current)
+        self._next: List[int] = []
+        self.cursor = -1
+
+    def activate(self, index: int) -> None:
+        if index in self._queued:
+            return
+        self._queued.add(index)
+        if index > self.cursor:
+            heapq.heappush(self._current, index)
+        else:
+            self._next.append(index)
+
+    def pop(self) -> Optional[int]:
+        if not self._current:
+            return None
+        index = heapq.heappop(self._current)
+        self._queued.discard(index)
+        self.cursor = index
+        return index
+
+    def start_next_pass(self) -> None:
+        self._current = self._next
+        heapq.heapify(self._current)
+        self._next = []
+        self.cursor = -1
+
+
+class AgendaEngine:
+    """Forward chaining that only re-tests rules reading a changed key."""
+
+    def __init__(self, rules: List[Rule]) -> None:
+        self.rules = sort_rules(rules)
+        self.names: List[str] = [rule.get("name", "<unnamed>") for rule in self.rules]
+        self.conditions: List[Tuple[Tuple[str, Any], ...]] = [
+            tuple(rule.get("if", {}).items()) for rule in self.rules
+        ]
+        self.actions: List[Tuple[Tuple[str, Any], ...]] = [
+            tuple(rule.get("then", {}).items()) for rule in self.rules
+        ]
+
+        # key -> indexes of rules whose "if" mentions the key
+        self.dependents: Dict[str, List[int]] = {}
+        for index, conditions in enumerate(self.conditions):
+            for key, _ in conditions:
+                self.dependents.setdefault(key, []).append(index)
+
+    def _matches(self, index: int, facts: Dict[str, Any]) -> bool:
+        return all(facts.get(key) == value for key, value in self.conditions[index])
+
+    def forward_chain(self, facts: Dict[str, Any]) -> Tuple[Dict[str, Any], List[str]]:
+        fired: List[str] = []
+        fired_names = set()
+        agenda = Agenda(index for index in range(len(self.rules)) if self._matches(index, facts))
+
+        while True:
+            changed = False
+
+            while (index := agenda.pop()) is not None:
+                name = self.names[index]
+                if name in fired_names or not self._matches(index, facts):
+                    continue
+
+                for key, value in self.actions[index]:
+                    # Do not overwrite protected keys once set
+                    if key in PROTECTED_KEYS and key in facts and facts.get(key) != value:
+                        continue
+
+                    if facts.get(key) != value:
+                        facts[key] = value
+                        changed = True
+                        for dependent in self.dependents.get(key, ()):
+                            agenda.activate(dependent)
+
+                fired.append(name)
+                fired_names.add(name)
+
+            if not changed:
+                break
+
+            agenda.start_next_pass()
+
+        return facts, fired
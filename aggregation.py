@@ -0,0 +1,411 @@
+import argparse
+import heapq
+import json
+import random
+import sys
+import time
+from array import array
+from collections import Counter
+from datetime import datetime
+from typing import Dict, List, Tuple, Any, Hashable, Iterable, Iterator, Optional
+
+
+# default windows: last 1, 5 and 60 minutes
+WINDOWS = (60, 300, 3600)
+
+UNKNOWN_ENDPOINT = "-"
+
+
+class _CountNode:
+    __slots__ = ("count", "items", "higher", "lower")
+
+    def __init__(self, count: int) -> None:
+        self.count = count
+        # insertion-ordered set of the items with this count
+        self.items: Dict[Hashable, None] = {}
+        self.higher: Optional["_CountNode"] = None
+        self.lower: Optional["_CountNode"] = None
+
+
+class RankedCounter:
+    """Counter that keeps its items ordered by count.
+
+    Items with equal counts share a node of a doubly linked list sorted by
+    count, so a +1/-1 step moves an item to a neighbouring node in constant
+    time and ``top(n)`` walks only the first ``n`` items.
+    """
+
+    def __init__(self) -> None:
+        self.counts: Dict[Hashable, int] = {}
+        self._nodes: Dict[int, _CountNode] = {}
+        self._top: Optional[_CountNode] = None
+        self._bottom: Optional[_CountNode] = None
+
+    def __len__(self) -> int:
+        return len(self.counts)
+
+    def get(self, item: Hashable) -> int:
+        return self.counts.get(item, 0)
+
+    def increment(self, item: Hashable) -> None:
+        count = self.counts.get(item, 0)
+        self._move(item, count, count + 1)
+
+    def decrement(self, item: Hashable) -> None:
+        count = self.counts[item]
+        self._move(item, count, count - 1)
+
+    def top(self, n: int) -> List[Tuple[Hashable, int]]:
+        found: List[Tuple[Hashable, int]] = []
+        node = self._top
+        while node is not None and len(found) < n:
+            for item in node.items:
+                found.append((item, node.count))
+                if len(found) == n:
+                    break
+            node = node.lower
+        return found
+
+    def _link(self, node: _CountNode, higher: Optional[_CountNode], lower: Optional[_CountNode]) -> None:
+        node.higher, node.lower = higher, lower
+        if higher is None:
+            self._top = node
+        else:
+            higher.lower = node
+        if lower is None:
+            self._bottom = node
+        else:
+            lower.higher = node
+
+    def _unlink(self, node: _CountNode) -> None:
+        if node.higher is None:
+            self._top = node.lower
+        else:
+            node.higher.lower = node.lower
+        if node.lower is None:
+            self._bottom = node.higher
+        else:
+            node.lower.higher = node.higher
+
+    def _move(self, item: Hashable, old: int, new: int) -> None:
+        node = self._nodes.get(old) if old else None
+        if new:
+            target = self._nodes.get(new)
+            if target is None:
+                target = self._nodes[new] = _CountNode(new)
+                # counts move by one, so the new node sits right next to the old one
+                if node is None:
+                    self._link(target, self._bottom, None)
+                elif new > old:
+                    self._link(target, node.higher, node)
+                else:
+                    self._link(target, node, node.lower)
+            target.items[item] = None
+            self.counts[item] = new
+        else:
+            del self.counts[item]
+        if node is not None:
+            del node.items[item]
+            if not node.items:
+                self._unlink(node)
+                del self._nodes[old]
+
+
+class CountMinSketch:
+    """Fixed-size approximate counter; estimates never undercount.
+
+    Sketches of equal shape and seed can be added to and subtracted from each
+    other cell by cell, which is how expired time buckets leave a window.
+    Cells written since the last ``clear`` are remembered, so merging and
+    clearing a sparsely used sketch only touch those.
+    """
+
+    def __init__(self, width: int = 2048, depth: int = 4, seed: int = 0) -> None:
+        self.width = width
+        self.depth = depth
+        self.salts = [random.Random(seed + row).getrandbits(64) for row in range(depth)]
+        self.rows = [array("q", bytes(8 * width)) for _ in range(depth)]
+        self.touched = [set() for _ in range(depth)]
+
+    def cells(self, item: Hashable) -> List[int]:
+        # one cell per row; hash once and reuse for sketches of the same shape
+        return [hash((salt, item)) % self.width for salt in self.salts]
+
+    def add(self, item: Hashable, count: int = 1, cells: Optional[List[int]] = None) -> None:
+        for row, touched, cell in zip(self.rows, self.touched, cells or self.cells(item)):
+            row[cell] += count
+            touched.add(cell)
+
+    def estimate(self, item: Hashable, cells: Optional[List[int]] = None) -> int:
+        return max(0, min(row[cell] for row, cell in zip(self.rows, cells or self.cells(item))))
+
+    def merge(self, other: "CountMinSketch", sign: int = 1) -> None:
+        for row, other_row, cells, touched in zip(self.rows, other.rows, other.touched, self.touched):
+            for cell in cells:
+                row[cell] += sign * other_row[cell]
+            touched.update(cells)
+
+    def clear(self) -> None:
+        for row, cells in zip(self.rows, self.touched):
+            for cell in cells:
+                row[cell] = 0
+            cells.clear()
+
+
+class _Bucket:
+    __slots__ = ("index", "events", "sketch")
+
+    def __init__(self) -> None:
+        self.index = -1
+        # (cause, category, endpoint) -> occurrences in this bucket; the
+        # endpoint is left out (None) when a sketch counts endpoints
+        self.events: Counter = Counter()
+        self.sketch: Optional[CountMinSketch] = None
+
+
+class SlidingWindow:
+    """Counts over the last ``span`` seconds in a ring of ``slots`` buckets.
+
+    The window covers the current bucket and the ``slots - 1`` before it,
+    i.e. between ``span * (slots - 1) / slots`` and ``span`` seconds.  When a
+    bucket is reused, its counts are stepped back out of the totals, so
+    every event costs O(1) to enter and to leave.  With ``sketch`` the
+    per-endpoint counts go to count-min sketches instead (memory independent
+    of the number of endpoints), and only the ``track`` heaviest endpoints
+    are remembered by name.
+    """
+
+    def __init__(
+        self,
+        span: float,
+        slots: int = 12,
+        sketch: bool = False,
+        sketch_width: int = 2048,
+        sketch_depth: int = 4,
+        track: int = 256,
+    ) -> None:
+        self.span = span
+        self.slots = slots
+        self.bucket_seconds = span / slots
+        self.current = -1
+        self.buckets = [_Bucket() for _ in range(slots)]
+        self.causes = RankedCounter()
+        self.categories = RankedCounter()
+
+        self.sketch: Optional[CountMinSketch] = None
+        if sketch:
+            self.sketch = CountMinSketch(sketch_width, sketch_depth)
+            for bucket in self.buckets:
+                bucket.sketch = CountMinSketch(sketch_width, sketch_depth)
+            self.track = track
+            # endpoint -> estimate when last seen, and a min-heap over them
+            self._tracked: Dict[str, int] = {}
+            self._heap: List[Tuple[int, str]] = []
+        else:
+            self.endpoints = RankedCounter()
+            self.endpoint_causes: Dict[str, RankedCounter] = {}
+
+    def advance(self, timestamp: float) -> None:
+        index = int(timestamp // self.bucket_seconds)
+        if index <= self.current:
+            return
+        # only the buckets that fall out of the window need expiring
+        for expired in range(max(self.current + 1, index - self.slots + 1), index + 1):
+            bucket = self.buckets[expired % self.slots]
+            if bucket.index >= 0:
+                self._expire(bucket)
+            bucket.index = expired
+        self.current = index
+
+    def add(self, cause: Optional[str], category: Optional[str], endpoint: str) -> None:
+        bucket = self.buckets[self.current % self.slots]
+        bucket.events[(cause, category, endpoint if self.sketch is None else None)] += 1
+        if cause is not None:
+            self.causes.increment(cause)
+        if category is not None:
+            self.categories.increment(category)
+
+        if self.sketch is None:
+            self.endpoints.increment(endpoint)
+            if cause is not None:
+                self.endpoint_causes.setdefault(endpoint, RankedCounter()).increment(cause)
+            return
+
+        endpoint_cells = self.sketch.cells(endpoint)
+        cause_cells = self.sketch.cells((endpoint, cause)) if cause is not None else None
+        for sketch in (self.sketch, bucket.sketch):
+            sketch.add(endpoint, cells=endpoint_cells)
+            if cause_cells is not None:
+                sketch.add((endpoint, cause), cells=cause_cells)
+        self._track(endpoint, self.sketch.estimate(endpoint, endpoint_cells))
+
+    def _expire(self, bucket: _Bucket) -> None:
+        for (cause, category, endpoint), count in bucket.events.items():
+            for _ in range(count):
+                if cause is not None:
+                    self.causes.decrement(cause)
+                if category is not None:
+                    self.categories.decrement(category)
+                if self.sketch is None:
+                    self.endpoints.decrement(endpoint)
+                    if cause is not None:
+                        causes = self.endpoint_causes[endpoint]
+                        causes.decrement(cause)
+                        if not causes.counts:
+                            del self.endpoint_causes[endpoint]
+        bucket.events.clear()
+        if self.sketch is not None:
+            self.sketch.merge(bucket.sketch, -1)
+            bucket.sketch.clear()
+
+    def _track(self, endpoint: str, estimate: int) -> None:
+        heap, tracked = self._heap, self._tracked
+        if endpoint in tracked or len(tracked) < self.track:
+            tracked[endpoint] = estimate
+            heapq.heappush(heap, (estimate, endpoint))
+        else:
+            # settle the lightest entry first: drop superseded heap entries and
+            # re-estimate ones that may have shrunk as buckets expired
+            while heap:
+                lightest, candidate = heap[0]
+                if tracked.get(candidate) != lightest:
+                    heapq.heappop(heap)
+                    continue
+                current = self.sketch.estimate(candidate)
+                if current == lightest:
+                    break
+                tracked[candidate] = current
+                heapq.heapreplace(heap, (current, candidate))
+            if heap and estimate > heap[0][0]:
+                _, evicted = heapq.heappop(heap)
+                del tracked[evicted]
+                tracked[endpoint] = estimate
+                heapq.heappush(heap, (estimate, endpoint))
+        if len(heap) > 4 * self.track:
+            self._heap = [(count, name) for name, count in tracked.items()]
+            heapq.heapify(self._heap)
+
+    def top_endpoints(self, n: int) -> List[Tuple[str, int]]:
+        if self.sketch is None:
+            return self.endpoints.top(n)
+        estimates = [(endpoint, self.sketch.estimate(endpoint)) for endpoint in self._tracked]
+        estimates = [(endpoint, count) for endpoint, count in estimates if count]
+        return sorted(estimates, key=lambda item: -item[1])[:n]
+
+    def top_causes(self, n: int, endpoint: Optional[str] = None) -> List[Tuple[str, int]]:
+        if endpoint is None:
+            return self.causes.top(n)
+        if self.sketch is None:
+            causes = self.endpoint_causes.get(endpoint)
+            return causes.top(n) if causes is not None else []
+        # the cause vocabulary is bounded by the KB, so estimating each is cheap
+        estimates = [(cause, self.sketch.estimate((endpoint, cause))) for cause in self.causes.counts]
+        estimates = [(cause, count) for cause, count in estimates if count]
+        return sorted(estimates, key=lambda item: -item[1])[:n]
+
+
+def event_time(result: Dict[str, Any]) -> Optional[float]:
+    # epoch seconds from a passthrough timestamp/time field, if it has one
+    for field in ("timestamp", "time"):
+        value = result.get(field)
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return float(value)
+        if isinstance(value, str):
+            for parse in (datetime.fromisoformat, lambda text: datetime.strptime(text, "%d/%b/%Y:%H:%M:%S %z")):
+                try:
+                    return parse(value).timestamp()
+                except ValueError:
+                    continue
+    return None
+
+
+class CauseAggregator:
+    """Live counts of diagnosed causes and categories, overall and per endpoint.
+
+    Feed it the result dicts ``streaming.py`` emits, in time order; each
+    window in ``windows`` (seconds) answers top-N queries on its own.  Events
+    take their time from a ``timestamp``/``time`` field when present and the
+    wall clock otherwise; an event older than the newest one is counted in
+    the current bucket.
+    """
+
+    def __init__(self, windows: Iterable[float] = WINDOWS, slots: int = 12, sketch: bool = False, **sketch_options: Any) -> None:
+        self.windows = {span: SlidingWindow(span, slots, sketch, **sketch_options) for span in windows}
+        self.events = 0
+        self.latest = 0.0
+
+    def add(self, result: Dict[str, Any], timestamp: Optional[float] = None) -> None:
+        if timestamp is None:
+            timestamp = event_time(result)
+        if timestamp is None:
+            timestamp = time.time()
+        self.latest = max(self.latest, timestamp)
+        endpoint = result.get("endpoint") or result.get("path") or UNKNOWN_ENDPOINT
+        for window in self.windows.values():
+            window.advance(self.latest)
+            window.add(result.get("cause"), result.get("category"), str(endpoint))
+        self.events += 1
+
+    def consume(self, results: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        # passes results through, so it can sit in a streaming pipeline
+        for result in results:
+            self.add(result)
+            yield result
+
+    def advance(self, timestamp: Optional[float] = None) -> None:
+        # lets windows expire while no traffic arrives
+        self.latest = max(self.latest, time.time() if timestamp is None else timestamp)
+        for window in self.windows.values():
+            window.advance(self.latest)
+
+    def top(self, kind: str, window: float = WINDOWS[0], n: int = 10, endpoint: Optional[str] = None) -> List[Tuple[Any, int]]:
+        counts = self.windows[window]
+        if kind == "cause":
+            return counts.top_causes(n, endpoint)
+        if kind == "category":
+            return counts.categories.top(n)
+        if kind == "endpoint":
+            return counts.top_endpoints(n)
+        raise ValueError(f"Unknown aggregate {kind!r}; expected cause, category or endpoint")
+
+    def snapshot(self, n: int = 10) -> Dict[str, Any]:
+        return {
+            "events": self.events,
+            "latest": self.latest,
+            "windows": {
+                str(int(span)): {kind: self.top(kind, span, n) for kind in ("cause", "category", "endpoint")}
+                for span in self.windows
+            },
+        }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Aggregate streaming.py diagnoses over sliding windows.")
+    parser.add_argument("input", nargs="?", default="-", help="diagnoses JSONL, '-' for stdin (default)")
+    parser.add_argument("--every", type=int, default=0, metavar="N", help="also print a snapshot every N records")
+    parser.add_argument("-n", "--top", type=int, default=10)
+    parser.add_argument("--sketch", action="store_true", help="count endpoints with count-min sketches")
+    args = parser.parse_args(argv)
+
+    aggregator = CauseAggregator(sketch=args.sketch)
+    source = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+    try:
+        for line in source:
+            try:
+                result = json.loads(line)
+            except ValueError:
+                continue
+            if not isinstance(result, dict) or "fired" not in result:
+                continue
+            aggregator.add(result)
+            if args.every and aggregator.events % args.every == 0:
+                print(json.dumps(aggregator.snapshot(args.top)))
+    finally:
+        if source is not sys.stdin:
+            source.close()
+    print(json.dumps(aggregator.snapshot(args.top)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
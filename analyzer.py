@@ -0,0 +1,292 @@
+import argparse
+import json
+import sys
+from typing import Dict, List, Set, Tuple, Any, Iterable, NamedTuple, Optional
+
+from kb import RULES, Rule
+from engine import PROTECTED_KEYS, forward_chain, kb_hash, sort_rules
+from symptoms import exhaustive_symptoms, input_keys
+
+
+class Conflict(NamedTuple):
+    # in engine order, i.e. the first one gets to write a protected key
+    rules: Tuple[str, str]
+    # key -> (first rule's value, second rule's value)
+    values: Dict[str, Tuple[Any, Any]]
+    resolved_by: str
+
+
+class Analysis(NamedTuple):
+    input_keys: List[str]
+    # values each derived key can take, and the values rules test inputs for
+    domains: Dict[str, List[Any]]
+    # rule -> the condition no reachable facts satisfy
+    unreachable: Dict[str, str]
+    # rule -> {key: rule that always wrote the protected key first}
+    subsumed: Dict[str, Dict[str, str]]
+    # same, for rules that keep other writes and only lose these
+    trimmed: Dict[str, Dict[str, str]]
+    conflicts: List[Conflict]
+    rules: List[Rule]
+
+
+def _first_pass(ordered: List[Rule], alive: Set[str], inputs: Set[str]) -> Set[str]:
+    # rules that might fire in the first pass: every condition is on an input,
+    # asks for None (holds until the key is derived) or on a key written by a
+    # rule before them that might fire in it too
+    available = set(inputs)
+    found = set()
+    for rule in ordered:
+        conditions = rule.get("if", {}).items()
+        if rule["name"] in alive and all(key in available or value is None for key, value in conditions):
+            found.add(rule["name"])
+            available.update(rule.get("then", {}))
+    return found
+
+
+def _shadowed(ordered: List[Rule], first_pass: Set[str], inputs: Set[str]) -> Dict[str, Dict[str, str]]:
+    # A protected write of R never takes effect when some S with only input
+    # conditions, all of them also R's, writes the same key and is evaluated
+    # first: inputs never change, so S fires in the first pass whenever R can
+    # fire at all, and the key is set (and stays set) before R gets to it.
+    position = {rule["name"]: index for index, rule in enumerate(ordered)}
+    static_writers: Dict[str, List[Rule]] = {}
+    for rule in ordered:
+        if all(key in inputs for key in rule.get("if", {})):
+            for key in rule.get("then", {}):
+                if key in PROTECTED_KEYS:
+                    static_writers.setdefault(key, []).append(rule)
+
+    shadowed: Dict[str, Dict[str, str]] = {}
+    for rule in ordered:
+        name = rule["name"]
+        conditions = rule.get("if", {}).items()
+        for key in rule.get("then", {}):
+            for writer in static_writers.get(key, []):
+                if writer["name"] == name or not writer.get("if", {}).items() <= conditions:
+                    continue
+                if position[writer["name"]] < position[name] or name not in first_pass:
+                    shadowed.setdefault(name, {})[key] = writer["name"]
+                    break
+    return shadowed
+
+
+def _reachable(
+    ordered: List[Rule],
+    candidates: Set[str],
+    shadowed: Dict[str, Dict[str, str]],
+    inputs: Set[str],
+) -> Tuple[Set[str], Dict[str, Set[Any]]]:
+    # least fixpoint: a rule can fire once each condition is on an input key,
+    # asks for None (an absent key) or for a value some firing rule writes
+    domains: Dict[str, Set[Any]] = {}
+    alive: Set[str] = set()
+    changed = True
+    while changed:
+        changed = False
+        for rule in ordered:
+            name = rule["name"]
+            if name in alive or name not in candidates:
+                continue
+            conditions = rule.get("if", {}).items()
+            if all(key in inputs or value is None or value in domains.get(key, ()) for key, value in conditions):
+                alive.add(name)
+                changed = True
+                for key, value in rule.get("then", {}).items():
+                    if key not in shadowed.get(name, {}):
+                        domains.setdefault(key, set()).add(value)
+    return alive, domains
+
+
+def _resolution(first: Rule, second: Rule) -> str:
+    if len(first.get("if", {})) != len(second.get("if", {})):
+        return "condition count"
+    if first.get("priority", 0) != second.get("priority", 0):
+        return "priority"
+    return "rule order"
+
+
+def _conflicts(ordered: List[Rule]) -> List[Conflict]:
+    # rules that can hold at once and write different values to a key,
+    # where neither is a more specific case of the other
+    writers: Dict[str, List[int]] = {}
+    for index, rule in enumerate(ordered):
+        for key in rule["then"]:
+            writers.setdefault(key, []).append(index)
+
+    pairs: Dict[Tuple[int, int], Dict[str, Tuple[Any, Any]]] = {}
+    for key, indexes in writers.items():
+        for position, first_index in enumerate(indexes):
+            first = ordered[first_index]
+            first_if = first.get("if", {})
+            for second_index in indexes[position + 1:]:
+                second = ordered[second_index]
+                second_if = second.get("if", {})
+                if first["then"][key] == second["then"][key]:
+                    continue
+                if first_if.items() <= second_if.items() or second_if.items() <= first_if.items():
+                    continue
+                if any(first_if[shared] != second_if[shared] for shared in first_if.keys() & second_if.keys()):
+                    continue
+                pairs.setdefault((first_index, second_index), {})[key] = (first["then"][key], second["then"][key])
+
+    return [
+        Conflict((ordered[first]["name"], ordered[second]["name"]), values, _resolution(ordered[first], ordered[second]))
+        for (first, second), values in sorted(pairs.items())
+    ]
+
+
+def analyze(rules: List[Rule] = RULES) -> Analysis:
+    """Finds rules that cannot change any diagnosis and drops them.
+
+    Only facts over input keys (keys no rule writes) are considered, which is
+    what every entry point builds.  Rules are unreachable when a condition
+    asks for a derived value no firing rule writes, and subsumed when each
+    of their writes is to a protected key a more general rule has always
+    set before them.  The optimized rules keep the engine order and give the
+    same final facts; ``fired`` only loses the removed rules.
+    """
+    ordered = sort_rules(rules)
+    inputs = set(input_keys(rules))
+
+    alive = {rule["name"] for rule in ordered}
+    while True:
+        shadowed = _shadowed(ordered, _first_pass(ordered, alive, inputs), inputs)
+        # fewer live rules only ever mean more shadowing and smaller domains
+        reachable, domains = _reachable(ordered, alive, shadowed, inputs)
+        if reachable == alive:
+            break
+        alive = reachable
+
+    unreachable: Dict[str, str] = {}
+    subsumed: Dict[str, Dict[str, str]] = {}
+    trimmed: Dict[str, Dict[str, str]] = {}
+    optimized: List[Rule] = []
+    for rule in rules:
+        name = rule["name"]
+        if name not in alive:
+            key, value = next(
+                (key, value) for key, value in rule.get("if", {}).items()
+                if key not in inputs and value is not None and value not in domains.get(key, ())
+            )
+            unreachable[name] = f"{key} is never {value!r}"
+            continue
+        lost = shadowed.get(name, {})
+        if len(lost) == len(rule["then"]):
+            subsumed[name] = lost
+            continue
+        if lost:
+            trimmed[name] = lost
+        kept = dict(rule)
+        kept["then"] = {key: value for key, value in rule["then"].items() if key not in lost}
+        optimized.append(kept)
+
+    # inputs can take any value; list the ones rules test for
+    tested: Dict[str, Dict[Any, None]] = {key: {} for key in input_keys(rules)}
+    for rule in rules:
+        for key, value in rule.get("if", {}).items():
+            if key in tested:
+                tested[key][value] = None
+    reported = {key: list(values) for key, values in tested.items()}
+    for key, values in domains.items():
+        if key not in inputs:
+            reported[key] = sorted(values, key=repr)
+
+    return Analysis(
+        input_keys=list(tested),
+        domains=reported,
+        unreachable=unreachable,
+        subsumed=subsumed,
+        trimmed=trimmed,
+        conflicts=_conflicts(sort_rules(optimized)),
+        rules=optimized,
+    )
+
+
+def verify(rules: List[Rule], optimized: List[Rule], inputs: Optional[Iterable[Dict[str, Any]]] = None) -> List[Dict[str, Any]]:
+    # every input combination must end in the same facts (key order
+    # included) and fire the same kept rules in the same order
+    kept = {rule["name"] for rule in optimized}
+    mismatches = []
+    for facts in exhaustive_symptoms(rules) if inputs is None else inputs:
+        expected, expected_fired = forward_chain(dict(facts), rules)
+        actual, actual_fired = forward_chain(dict(facts), optimized)
+        expected_fired = [name for name in expected_fired if name in kept]
+        if actual != expected or list(actual) != list(expected) or actual_fired != expected_fired:
+            mismatches.append({"facts": facts, "expected": (expected, expected_fired), "actual": (actual, actual_fired)})
+    return mismatches
+
+
+def report(rules: List[Rule], analysis: Analysis, mismatches: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+    return {
+        "kb": kb_hash(rules),
+        "optimized_kb": kb_hash(analysis.rules),
+        "rules": len(rules),
+        "kept": len(analysis.rules),
+        "input_keys": analysis.input_keys,
+        "domains": analysis.domains,
+        "unreachable": analysis.unreachable,
+        "subsumed": analysis.subsumed,
+        "trimmed": analysis.trimmed,
+        "conflicts": [conflict._asdict() for conflict in analysis.conflicts],
+        "mismatches": None if mismatches is None else len(mismatches),
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Find dead and shadowed rules and write an optimized rule set.")
+    parser.add_argument("--rules", action="append", metavar="PATH", help="rule files or directories (default: kb.RULES)")
+    parser.add_argument("-o", "--output", help="write the optimized rules as a JSON rule file (verified first)")
+    parser.add_argument("--report", help="write the analysis as JSON")
+    parser.add_argument("--verify", action="store_true", help="diff original and optimized rules on every input combination")
+    args = parser.parse_args(argv)
+
+    rules = RULES
+    if args.rules:
+        from loader import RuleFileError, load_rules
+        try:
+            rules = load_rules(args.rules)
+        except RuleFileError as error:
+            print(error, file=sys.stderr)
+            return 1
+
+    analysis = analyze(rules)
+    print(f"{len(analysis.rules)} of {len(rules)} rules kept")
+    for name, reason in analysis.unreachable.items():
+        print(f"  unreachable  {name}: {reason}")
+    for name, writers in analysis.subsumed.items():
+        print(f"  subsumed     {name}: {', '.join(f'{key} by {writer}' for key, writer in writers.items())}")
+    for name, writers in analysis.trimmed.items():
+        print(f"  trimmed      {name}: {', '.join(f'{key} by {writer}' for key, writer in writers.items())}")
+    # conflicts settled by specificity or priority are usually intended;
+    # ones only the position in the rule list settles are worth a look
+    resolutions: Dict[str, int] = {}
+    for conflict in analysis.conflicts:
+        resolutions[conflict.resolved_by] = resolutions.get(conflict.resolved_by, 0) + 1
+        if conflict.resolved_by == "rule order":
+            print(f"  conflict     {' vs '.join(conflict.rules)} on {', '.join(conflict.values)}")
+    if resolutions:
+        print(f"{len(analysis.conflicts)} conflicting rule pairs, resolved by "
+              + ", ".join(f"{resolution} ({count})" for resolution, count in resolutions.items()))
+
+    # an optimized set is only written once it is proven equivalent
+    mismatches = None
+    if args.verify or (args.output and analysis.rules != list(rules)):
+        mismatches = verify(rules, analysis.rules)
+        print(f"{len(mismatches)} mismatches")
+
+    if args.output and mismatches:
+        print(f"Not writing {args.output}: the optimized rules diagnose differently", file=sys.stderr)
+    elif args.output:
+        with open(args.output, "w", encoding="utf-8") as output:
+            json.dump(analysis.rules, output, indent=2)
+            output.write("\n")
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as output:
+            json.dump(report(rules, analysis, mismatches), output, indent=2, default=repr)
+            output.write("\n")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,161 @@
+from typing import Dict, List, Set, Tuple, Any, NamedTuple
+
+from kb import RULES, Rule
+from engine import forward_chain, sort_rules
+from symptoms import input_keys
+
+
+class QueryResult(NamedTuple):
+    goal: str
+    value: Any
+    facts: Dict[str, Any]
+    fired: List[str]
+    rules_considered: int
+    # input keys not given yet -> values that could let a rule towards the goal fire
+    needed: Dict[str, List[Any]]
+
+
+class BackwardChainer:
+    """Goal-directed queries over the rules that can produce a given key.
+
+    A goal is expanded into the rules writing it, and each derived key in
+    their conditions into a subgoal, each key expanded once.  Rules with a
+    condition the given inputs already rule out are dropped without expanding
+    their prerequisites, so whole rule families are never looked at.  Of the
+    rules reached, those that can actually fire (a least fixpoint over the
+    values they can produce) and lead to the goal are run with
+    ``engine.forward_chain``; no other rule can write a key they read, so the
+    goal comes out exactly as a full forward run would produce it.  KBs
+    with duplicate rule names are always run in full.
+    """
+
+    def __init__(self, rules: List[Rule] = RULES) -> None:
+        self.rules = sort_rules(rules)
+        self.inputs = set(input_keys(self.rules))
+        self.writers: Dict[str, List[int]] = {}
+        for index, rule in enumerate(self.rules):
+            for key in rule.get("then", {}):
+                self.writers.setdefault(key, []).append(index)
+        # a rule fires at most once per name, so dropping one rule can let a
+        # namesake fire that a full run would skip
+        names = [rule.get("name", "<unnamed>") for rule in self.rules]
+        self._exact = len(set(names)) == len(names)
+
+    def _derived_conditions(self, index: int) -> List[str]:
+        return [key for key in self.rules[index].get("if", {}) if key not in self.inputs]
+
+    def _plan(self, goal: str, facts: Dict[str, Any], open_world: bool) -> Tuple[List[int], Dict[str, List[Any]]]:
+        # 1. rules reachable backwards from the goal that the inputs allow;
+        # with open_world, absent inputs count as unknown rather than unset
+        missing: Dict[int, List[Tuple[str, Any]]] = {}
+        expanded: Set[str] = set()
+        frontier = [goal]
+        while frontier:
+            key = frontier.pop()
+            if key in expanded:
+                continue
+            expanded.add(key)
+
+            for index in self.writers.get(key, ()):
+                if index in missing:
+                    continue
+                unknown: List[Tuple[str, Any]] = []
+                allowed = True
+                for condition_key, value in self.rules[index].get("if", {}).items():
+                    if condition_key not in self.inputs:
+                        continue
+                    if condition_key in facts:
+                        allowed = facts[condition_key] == value
+                    elif open_world:
+                        unknown.append((condition_key, value))
+                    else:
+                        allowed = value is None
+                    if not allowed:
+                        break
+                if allowed:
+                    missing[index] = unknown
+                    frontier.extend(self._derived_conditions(index))
+
+        # 2. least fixpoint of the reached rules whose derived conditions can
+        # be met by a given value or by a value some possible rule writes
+        values: Dict[str, Set[Any]] = {}
+        possible: Set[int] = set()
+
+        def can_hold(key: str, value: Any) -> bool:
+            if key in facts:
+                if facts[key] == value:
+                    return True
+            elif value is None:
+                return True
+            try:
+                return value in values.get(key, ())
+            except TypeError:
+                return True
+
+        progress = True
+        while progress:
+            progress = False
+            for index in sorted(set(missing) - possible):
+                rule = self.rules[index]
+                if all(can_hold(key, value) for key, value in rule.get("if", {}).items() if key not in self.inputs):
+                    possible.add(index)
+                    progress = True
+                    for key, value in rule.get("then", {}).items():
+                        try:
+                            values.setdefault(key, set()).add(value)
+                        except TypeError:
+                            pass
+
+        # 3. the possible rules that actually lead to the goal
+        relevant: Set[int] = set()
+        expanded = set()
+        frontier = [goal]
+        while frontier:
+            key = frontier.pop()
+            if key in expanded:
+                continue
+            expanded.add(key)
+            for index in self.writers.get(key, ()):
+                if index in possible and index not in relevant:
+                    relevant.add(index)
+                    frontier.extend(self._derived_conditions(index))
+
+        needed: Dict[str, Dict[Any, None]] = {}
+        for index in sorted(relevant):
+            for key, value in missing[index]:
+                needed.setdefault(key, {})[value] = None
+        return sorted(relevant), {key: list(options) for key, options in needed.items()}
+
+    def relevant_rules(self, goal: str, facts: Dict[str, Any]) -> List[Rule]:
+        relevant, _ = self._plan(goal, facts, False)
+        return [self.rules[index] for index in relevant]
+
+    def needed_inputs(self, goal: str, facts: Dict[str, Any]) -> Dict[str, List[Any]]:
+        _, needed = self._plan(goal, facts, True)
+        return needed
+
+    def query(self, goal: str, facts: Dict[str, Any]) -> QueryResult:
+        rules = self.relevant_rules(goal, facts) if self._exact else self.rules
+        final_facts, fired = forward_chain(dict(facts), rules)
+        return QueryResult(
+            goal=goal,
+            value=final_facts.get(goal),
+            facts=final_facts,
+            fired=fired,
+            rules_considered=len(rules),
+            needed=self.needed_inputs(goal, facts),
+        )
+
+
+if __name__ == "__main__":
+    import json
+    import sys
+
+    # python backward.py recommendation status_code=401 has_auth_header=no
+    goal, *assignments = sys.argv[1:] or ["recommendation"]
+    given: Dict[str, Any] = {}
+    for assignment in assignments:
+        key, _, raw = assignment.partition("=")
+        given[key] = int(raw) if raw.isdigit() else raw
+    result = BackwardChainer().query(goal, given)
+    print(json.dumps(result._asdict(), indent=2))
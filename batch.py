@@ -0,0 +1,168 @@
+from typing import Dict, List, Tuple, Any
+
+import numpy as np
+
+from kb import Rule
+from engine import PROTECTED_KEYS, sort_rules
+
+
+# code 0 stands for facts.get(key) is None, -1 for values no rule can ever equal
+_NONE_CODE = 0
+_OPAQUE_CODE = -1
+
+
+class BatchEngine:
+    """Forward chaining over a whole batch of fact dicts with NumPy.
+
+    Facts are encoded as integer-coded columns (one per attribute used by the
+    rules) and rule conditions/actions as rules x attributes matrices.  Each
+    inference round fires, for every row still running, the next matching
+    rule after that row's scan cursor, so the per-row result is exactly the
+    one ``engine.forward_chain`` produces.
+    """
+
+    def __init__(self, rules: List[Rule]) -> None:
+        self.rules = sort_rules(rules)
+        self.names: List[str] = [rule.get("name", "<unnamed>") for rule in self.rules]
+        self.actions: List[Tuple[Tuple[str, Any], ...]] = [
+            tuple(rule.get("then", {}).items()) for rule in self.rules
+        ]
+
+        attributes: Dict[str, int] = {}
+        self.vocab: List[Dict[Any, int]] = []
+        for rule in self.rules:
+            for part in ("if", "then"):
+                for key, value in rule.get(part, {}).items():
+                    if key not in attributes:
+                        attributes[key] = len(attributes)
+                        self.vocab.append({})
+                    self._code(value, self.vocab[attributes[key]])
+        self.attributes = attributes
+
+        n_rules, n_attributes = len(self.rules), len(attributes)
+        self.cond_mask = np.zeros((n_rules, n_attributes), dtype=bool)
+        self.cond_code = np.zeros((n_rules, n_attributes), dtype=np.int32)
+        self.then_mask = np.zeros((n_rules, n_attributes), dtype=bool)
+        self.then_code = np.zeros((n_rules, n_attributes), dtype=np.int32)
+        for index, rule in enumerate(self.rules):
+            for mask, code, part in (
+                (self.cond_mask, self.cond_code, "if"),
+                (self.then_mask, self.then_code, "then"),
+            ):
+                for key, value in rule.get(part, {}).items():
+                    column = attributes[key]
+                    mask[index, column] = True
+                    code[index, column] = self._code(value, self.vocab[column])
+
+        self.protected = np.array([key in PROTECTED_KEYS for key in attributes], dtype=bool)
+
+        name_ids: Dict[str, int] = {}
+        self.name_of_rule = np.array(
+            [name_ids.setdefault(name, len(name_ids)) for name in self.names], dtype=np.int64
+        )
+        self.n_names = len(name_ids)
+
+    @staticmethod
+    def _code(value: Any, vocab: Dict[Any, int]) -> int:
+        if value is None:
+            return _NONE_CODE
+        try:
+            return vocab.setdefault(value, len(vocab) + 1)
+        except TypeError:
+            return _OPAQUE_CODE
+
+    def _encode(self, batch: List[Dict[str, Any]]) -> Tuple[np.ndarray, np.ndarray]:
+        values = np.zeros((len(batch), len(self.attributes)), dtype=np.int32)
+        present = np.zeros((len(batch), len(self.attributes)), dtype=bool)
+        # values unseen in the KB get batch-local codes so the compiled vocab stays fixed
+        local_vocab = [dict(vocab) for vocab in self.vocab]
+        for row, facts in enumerate(batch):
+            for key, value in facts.items():
+                column = self.attributes.get(key)
+                if column is None:
+                    continue
+                present[row, column] = True
+                values[row, column] = self._code(value, local_vocab[column])
+        return values, present
+
+    def _match(self, values: np.ndarray) -> np.ndarray:
+        matched = np.ones((values.shape[0], len(self.rules)), dtype=bool)
+        for column in range(values.shape[1]):
+            tests = self.cond_mask[:, column]
+            if not tests.any():
+                continue
+            matched &= ~tests | (values[:, column, None] == self.cond_code[None, :, column])
+        return matched
+
+    def _fired_indexes(self, batch: List[Dict[str, Any]]) -> List[List[int]]:
+        n_rows, n_rules = len(batch), len(self.rules)
+        values, present = self._encode(batch)
+        fired_names = np.zeros((n_rows, self.n_names), dtype=bool)
+        cursor = np.full(n_rows, -1, dtype=np.int64)
+        changed = np.zeros(n_rows, dtype=bool)
+        active = np.ones(n_rows, dtype=bool)
+        positions = np.arange(n_rules)
+        fired: List[List[int]] = [[] for _ in range(n_rows)]
+
+        while active.any():
+            rows = np.flatnonzero(active)
+            candidates = (
+                self._match(values[rows])
+                & ~fired_names[rows][:, self.name_of_rule]
+                & (positions[None, :] > cursor[rows, None])
+            )
+            has_candidate = candidates.any(axis=1)
+
+            # rows whose scan reached the end of the rule list finish a pass
+            finished = rows[~has_candidate]
+            active[finished[~changed[finished]]] = False
+            cursor[finished] = -1
+            changed[finished] = False
+
+            rows = rows[has_candidate]
+            if rows.size == 0:
+                continue
+            chosen = candidates[has_candidate].argmax(axis=1)
+
+            row_values = values[rows]
+            then_mask = self.then_mask[chosen]
+            then_code = self.then_code[chosen]
+            differs = row_values != then_code
+            # Do not overwrite protected keys once set
+            blocked = self.protected[None, :] & present[rows] & differs
+            update = then_mask & ~blocked & differs
+
+            values[rows] = np.where(update, then_code, row_values)
+            present[rows] |= update
+            changed[rows] |= update.any(axis=1)
+            fired_names[rows, self.name_of_rule[chosen]] = True
+            cursor[rows] = chosen
+
+            for row, index in zip(rows.tolist(), chosen.tolist()):
+                fired[row].append(index)
+
+        return fired
+
+    def forward_chain_batch(
+        self, batch: List[Dict[str, Any]], chunk_size: int = 4096
+    ) -> List[Tuple[Dict[str, Any], List[str]]]:
+        results: List[Tuple[Dict[str, Any], List[str]]] = []
+        for start in range(0, len(batch), chunk_size):
+            chunk = batch[start:start + chunk_size]
+            for facts, indexes in zip(chunk, self._fired_indexes(chunk)):
+                # replaying the fired rules in order rebuilds the facts dict
+                # exactly as the scalar engine mutates it, key order included
+                for index in indexes:
+                    for key, value in self.actions[index]:
+                        if key in PROTECTED_KEYS and key in facts and facts.get(key) != value:
+                            continue
+                        if facts.get(key) != value:
+                            facts[key] = value
+                results.append((facts, [self.names[index] for index in indexes]))
+        return results
+
+
+def forward_chain_batch(
+    batch: List[Dict[str, Any]], rules: List[Rule]
+) -> List[Tuple[Dict[str, Any], List[str]]]:
+    return BatchEngine(rules).forward_chain_batch(batch)
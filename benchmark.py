@@ -0,0 +1,383 @@
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+from functools import partial
+from typing import Dict, List, Tuple, Any, Callable, Optional
+
+from kb import RULES, Rule
+from engine import forward_chain, kb_hash
+from symptoms import enumerate_symptoms
+
+
+Engine = Callable[[Dict[str, Any]], Tuple[Dict[str, Any], List[str]]]
+
+DEFAULT_OUTPUT = "benchmark_results.json"
+
+# cold-start budget of the headless CLI
+STARTUP_BUDGET = 0.050
+
+# rough share of each status code in production error traffic
+STATUS_WEIGHTS = {404: 30, 401: 15, 400: 15, 500: 10, 403: 8, 429: 6, 502: 5, 503: 4, 504: 3, 405: 2, 415: 2}
+
+
+def _rete(rules: List[Rule]) -> Engine:
+    from rete import ReteNetwork
+    return ReteNetwork(rules).forward_chain
+
+
+def _agenda(rules: List[Rule]) -> Engine:
+    from agenda import AgendaEngine
+    return AgendaEngine(rules).forward_chain
+
+
+def _compact(rules: List[Rule]) -> Engine:
+    from compact import CompactKB
+    return CompactKB(rules).forward_chain
+
+
+def _partitioned(rules: List[Rule]) -> Engine:
+    from partition import PartitionedEngine
+    return PartitionedEngine(rules).forward_chain
+
+
+def _compiled(rules: List[Rule]) -> Engine:
+    from rulecompiler import compile_rules
+    return compile_rules(rules)
+
+
+def _cached(rules: List[Rule]) -> Engine:
+    from cache import DiagnosisCache
+    return DiagnosisCache(rules).forward_chain
+
+
+ENGINES: Dict[str, Callable[[List[Rule]], Engine]] = {
+    "forward_chain": lambda rules: partial(forward_chain, rules=rules),
+    "rete": _rete,
+    "agenda": _agenda,
+    "compact": _compact,
+    "partitioned": _partitioned,
+    "compiled": _compiled,
+    "cached": _cached,
+}
+
+
+def _evaluation_counter(name: str, rules: List[Rule]) -> Optional[Callable[[Dict[str, Any]], int]]:
+    # rules whose conditions get tested per diagnosis, for engines that test
+    # rules one by one
+    if name == "forward_chain":
+        from instrumentation import Instrumentation
+
+        def count(facts: Dict[str, Any]) -> int:
+            instrumentation = Instrumentation()
+            forward_chain(facts, rules, instrumentation)
+            return instrumentation.tests
+
+        return count
+    if name == "partitioned":
+        from partition import PartitionedEngine
+        engine = PartitionedEngine(rules)
+        return lambda facts: engine.run(facts)[2]
+    return None
+
+
+def realistic_workload(size: int, seed: int = 0) -> List[Dict[str, Any]]:
+    # UI symptom combinations, with status codes drawn by STATUS_WEIGHTS
+    rng = random.Random(seed)
+    by_status: Dict[int, List[Dict[str, Any]]] = {}
+    for facts in enumerate_symptoms():
+        by_status.setdefault(facts["status_code"], []).append(facts)
+    statuses = [status for status in STATUS_WEIGHTS if status in by_status]
+    weights = [STATUS_WEIGHTS[status] for status in statuses]
+    return [
+        dict(rng.choice(by_status[status]))
+        for status in rng.choices(statuses, weights=weights, k=size)
+    ]
+
+
+def synthetic_kb(
+    size: int,
+    arity: int = 2,
+    depth: int = 3,
+    cardinality: int = 10,
+    width: int = 8,
+    seed: int = 0,
+) -> List[Rule]:
+    """Layered KB of ``size`` rules.
+
+    Rules of layer ``n`` (1..depth) test ``arity`` keys of layer ``n - 1``
+    (layer 0 being the inputs ``in0``..) and set one key of layer ``n``, so
+    inference chains up to ``depth`` rules deep; the last layer also sets
+    ``cause``.  Every key takes ``cardinality`` distinct values.
+    """
+    rng = random.Random(seed)
+    layers = [[f"in{column}" for column in range(width)]]
+    layers += [[f"l{layer}_{column}" for column in range(width)] for layer in range(1, depth + 1)]
+
+    rules: List[Rule] = []
+    for number in range(size):
+        layer = 1 + number * depth // size
+        tested = rng.sample(layers[layer - 1], min(arity, width))
+        then = {rng.choice(layers[layer]): rng.randrange(cardinality)}
+        if layer == depth:
+            then["cause"] = f"cause_{rng.randrange(cardinality)}"
+        rules.append({
+            "name": f"Synthetic_{number}",
+            "priority": rng.randrange(20),
+            "if": {key: rng.randrange(cardinality) for key in tested},
+            "then": then,
+        })
+    return rules
+
+
+def synthetic_workload(size: int, cardinality: int = 10, width: int = 8, seed: int = 0) -> List[Dict[str, Any]]:
+    rng = random.Random(seed)
+    return [{f"in{column}": rng.randrange(cardinality) for column in range(width)} for _ in range(size)]
+
+
+def _percentile(ordered: List[int], share: float) -> int:
+    # nearest rank
+    if not ordered:
+        return 0
+    return ordered[min(len(ordered) - 1, max(0, int(round(share * len(ordered))) - 1))]
+
+
+def _reference_seconds(iterations: int = 100000) -> float:
+    # a fixed pure-Python loop, timed in every round so that throughput can
+    # be expressed relative to how fast the machine is at that moment
+    start = time.perf_counter()
+    total = 0
+    for number in range(iterations):
+        total += number * number % 7
+    return time.perf_counter() - start
+
+
+def measure(
+    name: str,
+    rules: List[Rule],
+    workload: List[Dict[str, Any]],
+    warmup: int = 100,
+    rounds: int = 5,
+    min_round_seconds: float = 0.25,
+) -> Dict[str, Any]:
+    """Times one engine over the workload in several rounds.
+
+    Each round repeats the workload for at least ``min_round_seconds``, so
+    small workloads are not timed over a few milliseconds.  ``throughput``
+    is the median over the rounds; ``relative_throughput`` is the median of
+    each round's throughput times a reference loop's time taken in the same
+    round, which cancels most of the drift of shared or frequency-scaled
+    machines between runs.  Baselines are compared on it.  Latency
+    percentiles pool every round's samples and are informational only.
+    ``peak_memory_bytes`` is the tracemalloc peak of a separate, traced run
+    that builds the engine and diagnoses the whole workload once (tracing
+    would distort the timings).
+    """
+    factory = ENGINES[name]
+    warmup = min(warmup, len(workload) // 10)
+    engine = factory(rules)
+    for facts in workload[:warmup]:
+        engine(dict(facts))
+
+    latencies: List[int] = []
+    throughputs: List[float] = []
+    relative: List[float] = []
+    for _ in range(max(rounds, 1)):
+        reference = _reference_seconds()
+        total = diagnoses = 0
+        while total < min_round_seconds * 1e9 or not diagnoses:
+            for facts in workload:
+                facts = dict(facts)
+                start = time.perf_counter_ns()
+                engine(facts)
+                elapsed = time.perf_counter_ns() - start
+                latencies.append(elapsed)
+                total += elapsed
+            diagnoses += len(workload)
+            if not workload:
+                break
+        throughputs.append(diagnoses / (total / 1e9) if total else 0.0)
+        relative.append(throughputs[-1] * reference)
+    latencies.sort()
+    throughputs.sort()
+    relative.sort()
+
+    counter = _evaluation_counter(name, rules)
+    evaluations = None
+    if counter is not None:
+        evaluations = sum(counter(dict(facts)) for facts in workload) / max(len(workload), 1)
+
+    tracemalloc.start()
+    try:
+        engine = factory(rules)
+        for facts in workload:
+            engine(dict(facts))
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "engine": name,
+        "diagnoses": len(workload),
+        "rounds": len(throughputs),
+        "throughput": throughputs[len(throughputs) // 2],
+        "relative_throughput": relative[len(relative) // 2],
+        "p50_us": _percentile(latencies, 0.50) / 1e3,
+        "p99_us": _percentile(latencies, 0.99) / 1e3,
+        "peak_memory_bytes": peak,
+        "evaluations_per_diagnosis": evaluations,
+    }
+
+
+def run_suite(
+    suite: str,
+    rules: List[Rule],
+    workload: List[Dict[str, Any]],
+    engines: List[str],
+    log: Optional[Callable[[str], None]] = None,
+    rounds: int = 5,
+) -> List[Dict[str, Any]]:
+    results = []
+    for name in engines:
+        result = measure(name, rules, workload, rounds=rounds)
+        result.update({"suite": suite, "rules": len(rules), "kb_hash": kb_hash(rules)})
+        results.append(result)
+        if log is not None:
+            log(format_result(result))
+    return results
+
+
+def format_result(result: Dict[str, Any]) -> str:
+    evaluations = result["evaluations_per_diagnosis"]
+    return (
+        f"{result['suite']:<18} {result['engine']:<14} "
+        f"{result['throughput']:>12.0f}/s  p50 {result['p50_us']:>9.1f} us  p99 {result['p99_us']:>9.1f} us  "
+        f"peak {result['peak_memory_bytes'] / 1024:>9.0f} KiB  "
+        f"evals {'-' if evaluations is None else format(evaluations, '.1f')}"
+    )
+
+
+def compare(results: List[Dict[str, Any]], baseline: List[Dict[str, Any]], tolerance: float = 0.15) -> List[str]:
+    # regressions against the baseline run of the same suite, KB and engine;
+    # gated on machine-relative median throughput and memory, not on tail
+    # latency, which a few hundred samples cannot pin down
+    previous = {(entry["suite"], entry["kb_hash"], entry["engine"]): entry for entry in baseline}
+    regressions = []
+    for result in results:
+        before = previous.get((result["suite"], result["kb_hash"], result["engine"]))
+        if before is None:
+            continue
+        label = f"{result['suite']}/{result['engine']}"
+        if result["relative_throughput"] < before["relative_throughput"] * (1 - tolerance):
+            regressions.append(
+                f"{label}: relative throughput {before['relative_throughput']:.1f} -> {result['relative_throughput']:.1f} "
+                f"({before['throughput']:.0f}/s -> {result['throughput']:.0f}/s)"
+            )
+        if result["peak_memory_bytes"] > before["peak_memory_bytes"] * (1 + tolerance):
+            regressions.append(f"{label}: peak_memory_bytes {before['peak_memory_bytes']} -> {result['peak_memory_bytes']}")
+        # deterministic for a given KB and workload, so any increase counts
+        if before["evaluations_per_diagnosis"] is not None and result["evaluations_per_diagnosis"] is not None:
+            if result["evaluations_per_diagnosis"] > before["evaluations_per_diagnosis"]:
+                regressions.append(
+                    f"{label}: evaluations per diagnosis "
+                    f"{before['evaluations_per_diagnosis']:.1f} -> {result['evaluations_per_diagnosis']:.1f}"
+                )
+    return regressions
+
+
+def startup_benchmark(runs: int = 20) -> List[Dict[str, Any]]:
+    # wall clock of fresh interpreters, bytecode caches warm; "overhead" is
+    # what each command adds to a bare interpreter
+    here = os.path.dirname(os.path.abspath(__file__))
+    # let the first run write the bytecode caches a normal install has
+    environment = {key: value for key, value in os.environ.items() if key != "PYTHONDONTWRITEBYTECODE"}
+    commands = {
+        "interpreter": [sys.executable, "-c", "pass"],
+        "diagnose": [sys.executable, "-m", "diagnose", "--status", "401", "--keyword", "expired"],
+        "streamlit import": [sys.executable, "-c", "import streamlit"],
+    }
+    results = []
+    for name, command in commands.items():
+        timings = []
+        for _ in range(runs + 1):
+            start = time.perf_counter()
+            completed = subprocess.run(command, cwd=here, env=environment, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            timings.append(time.perf_counter() - start)
+        if completed.returncode not in (0, 1):
+            raise RuntimeError(f"{' '.join(command)} exited with {completed.returncode}")
+        # the first run only warms caches
+        timings = sorted(timings[1:])
+        results.append({"command": name, "median": timings[len(timings) // 2], "min": timings[0]})
+    for result in results:
+        result["overhead"] = result["median"] - results[0]["median"]
+    return results
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the inference engines.")
+    parser.add_argument("--engines", default=",".join(ENGINES), help="comma-separated, from: " + ", ".join(ENGINES))
+    parser.add_argument("--requests", type=int, default=2000, help="diagnoses per suite")
+    parser.add_argument("--synthetic", default="1000", help="comma-separated synthetic KB sizes, empty for none")
+    parser.add_argument("--synthetic-requests", type=int, default=200, help="diagnoses per synthetic suite")
+    parser.add_argument("--arity", type=int, default=2)
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--cardinality", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--rounds", type=int, default=5, help="timed passes over each workload; throughput is their median")
+    parser.add_argument("-o", "--output", default=DEFAULT_OUTPUT)
+    parser.add_argument("--baseline", help="results file of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed relative throughput and memory change")
+    parser.add_argument("--startup", type=int, nargs="?", const=20, metavar="RUNS", help="only time CLI cold starts")
+    args = parser.parse_args(argv)
+
+    if args.startup:
+        rows = startup_benchmark(args.startup)
+        for row in rows:
+            print(f"{row['command']:<17} median {row['median'] * 1e3:7.1f} ms  min {row['min'] * 1e3:7.1f} ms  "
+                  f"+{row['overhead'] * 1e3:.1f} ms")
+        cli = next(row for row in rows if row["command"] == "diagnose")
+        print(f"diagnose cold start {'within' if cli['median'] <= STARTUP_BUDGET else 'over'} "
+              f"the {STARTUP_BUDGET * 1e3:.0f} ms budget")
+        return 0 if cli["median"] <= STARTUP_BUDGET else 1
+
+    engines = [name for name in args.engines.split(",") if name]
+    unknown = [name for name in engines if name not in ENGINES]
+    if unknown:
+        parser.error(f"unknown engines: {', '.join(unknown)}")
+
+    results = run_suite("kb", RULES, realistic_workload(args.requests, args.seed), engines, print, args.rounds)
+    for size in (int(size) for size in args.synthetic.split(",") if size):
+        rules = synthetic_kb(size, args.arity, args.depth, args.cardinality, seed=args.seed)
+        workload = synthetic_workload(args.synthetic_requests, args.cardinality, seed=args.seed)
+        results += run_suite(f"synthetic-{size}", rules, workload, engines, print, args.rounds)
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "arguments": vars(args),
+        },
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as output:
+        json.dump(report, output, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as source:
+            regressions = compare(results, json.load(source)["results"], args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        print(f"{len(regressions)} regressions against {args.baseline}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
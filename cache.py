@@ -0,0 +1,141 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Tuple, Any, NamedTuple, Optional
+
+from kb import RULES, Rule
+from engine import kb_hash
+from rete import ReteNetwork
+
+
+class CacheInfo(NamedTuple):
+    hits: int
+    misses: int
+    evictions: int
+    invalidations: int
+    uncacheable: int
+    maxsize: int
+    currsize: int
+
+
+def _freeze(value: Any) -> Any:
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    if isinstance(value, (set, frozenset)):
+        return frozenset(_freeze(item) for item in value)
+    hash(value)
+    return value
+
+
+def canonical_facts(facts: Dict[str, Any]) -> Tuple[Tuple[str, Any], ...]:
+    return tuple(sorted((key, _freeze(value)) for key, value in facts.items()))
+
+
+class DiagnosisCache:
+    """Bounded LRU cache of diagnoses in front of the Rete network.
+
+    Entries are keyed on the KB version hash and a canonical frozen form of
+    the input facts.  The KB is cheaply re-checked on every call (same list
+    object, same length) and fully re-hashed at most every
+    ``revalidate_interval`` seconds, so in-place edits of ``RULES`` drop the
+    cache without hashing the whole KB per lookup.  Unlike
+    ``engine.forward_chain`` the input dict is never mutated, and every result
+    is a fresh copy.
+    """
+
+    def __init__(
+        self,
+        rules: List[Rule] = RULES,
+        maxsize: int = 4096,
+        revalidate_interval: float = 1.0,
+    ) -> None:
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+        self.rules = rules
+        self.maxsize = maxsize
+        self.revalidate_interval = revalidate_interval
+
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Tuple[str, Any], Tuple[Dict[str, Any], Tuple[str, ...]]]" = OrderedDict()
+        self._hits = self._misses = self._evictions = self._invalidations = self._uncacheable = 0
+        self._compile()
+
+    def _compile(self) -> None:
+        self.version = kb_hash(self.rules)
+        self._network = ReteNetwork(self.rules)
+        self._fingerprint = (id(self.rules), len(self.rules))
+        self._checked_at = time.monotonic()
+
+    def _revalidate(self) -> None:
+        now = time.monotonic()
+        fingerprint = (id(self.rules), len(self.rules))
+        if fingerprint == self._fingerprint and now - self._checked_at < self.revalidate_interval:
+            return
+
+        self._checked_at = now
+        if fingerprint == self._fingerprint and kb_hash(self.rules) == self.version:
+            return
+        self._compile()
+        self._entries.clear()
+        self._invalidations += 1
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._compile()
+            self._entries.clear()
+            self._invalidations += 1
+
+    def forward_chain(self, facts: Dict[str, Any]) -> Tuple[Dict[str, Any], List[str]]:
+        with self._lock:
+            self._revalidate()
+            network = self._network
+            try:
+                key: Optional[Tuple[str, Any]] = (self.version, canonical_facts(facts))
+            except TypeError:
+                key = None
+                self._uncacheable += 1
+
+            if key is not None:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                    self._hits += 1
+                    # equal facts may differ in key order or type (1 vs True),
+                    # so only the derivations are replayed onto the caller's
+                    final_facts = dict(facts)
+                    final_facts.update(entry[0])
+                    return final_facts, list(entry[1])
+                self._misses += 1
+
+        final_facts, fired = network.forward_chain(dict(facts))
+        if key is None:
+            return final_facts, fired
+
+        with self._lock:
+            # a concurrent invalidation makes this result stale for the new KB
+            if key[0] == self.version:
+                derived = {name: value for name, value in final_facts.items() if name not in facts or facts[name] != value}
+                self._entries[key] = (derived, tuple(fired))
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+                    self._evictions += 1
+        return final_facts, fired
+
+    def cache_info(self) -> CacheInfo:
+        with self._lock:
+            return CacheInfo(
+                self._hits,
+                self._misses,
+                self._evictions,
+                self._invalidations,
+                self._uncacheable,
+                self.maxsize,
+                len(self._entries),
+            )
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
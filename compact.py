@@ -0,0 +1,205 @@
+import sys
+import time
+from array import array
+from typing import Dict, List, Set, Tuple, Any, Optional
+
+from kb import RULES, Rule
+from engine import PROTECTED_KEYS, sort_rules
+
+
+# value id 0 stands for facts.get(key) is None
+NONE_ID = 0
+
+
+class SymbolTable:
+    __slots__ = ("ids", "symbols")
+
+    def __init__(self) -> None:
+        self.ids: Dict[Any, int] = {}
+        self.symbols: List[Any] = []
+
+    def intern(self, symbol: Any) -> int:
+        symbol_id = self.ids.get(symbol)
+        if symbol_id is None:
+            symbol_id = self.ids[symbol] = len(self.symbols)
+            self.symbols.append(symbol)
+        return symbol_id
+
+    def __len__(self) -> int:
+        return len(self.symbols)
+
+
+class CompactRule:
+    # half-open ranges into the flat condition/action arrays of a CompactKB
+    __slots__ = ("name_id", "cond_start", "cond_stop", "then_start", "then_stop")
+
+    def __init__(self, name_id: int, cond_start: int, cond_stop: int, then_start: int, then_stop: int) -> None:
+        self.name_id = name_id
+        self.cond_start = cond_start
+        self.cond_stop = cond_stop
+        self.then_start = then_start
+        self.then_stop = then_stop
+
+
+class CompactKB:
+    """Rules as slotted objects over interned attribute and value ids.
+
+    Conditions and actions of all rules live in flat integer arrays that each
+    rule indexes into.  Fact state during inference is a fixed-size array of
+    value ids (one slot per attribute), and fired rules are flags in a
+    bytearray indexed by name id.
+    """
+
+    __slots__ = (
+        "attributes", "values", "names", "rules", "protected",
+        "cond_attrs", "cond_values", "then_attrs", "then_values",
+    )
+
+    def __init__(self, rules: List[Rule]) -> None:
+        self.attributes = SymbolTable()
+        self.values = SymbolTable()
+        self.names = SymbolTable()
+        self.values.intern(None)
+
+        self.cond_attrs = array("I")
+        self.cond_values = array("I")
+        self.then_attrs = array("I")
+        self.then_values = array("I")
+        self.rules: List[CompactRule] = []
+        for rule in sort_rules(rules):
+            cond_start, then_start = len(self.cond_attrs), len(self.then_attrs)
+            for key, value in rule.get("if", {}).items():
+                self.cond_attrs.append(self.attributes.intern(key))
+                self.cond_values.append(self.values.intern(value))
+            for key, value in rule.get("then", {}).items():
+                self.then_attrs.append(self.attributes.intern(key))
+                self.then_values.append(self.values.intern(value))
+            self.rules.append(CompactRule(
+                self.names.intern(rule.get("name", "<unnamed>")),
+                cond_start, len(self.cond_attrs), then_start, len(self.then_attrs),
+            ))
+
+        self.protected = 0
+        for attribute_id, key in enumerate(self.attributes.symbols):
+            if key in PROTECTED_KEYS:
+                self.protected |= 1 << attribute_id
+
+    def encode(self, facts: Dict[str, Any]) -> Tuple[array, int]:
+        state = array("q", bytes(8 * len(self.attributes)))
+        present = 0
+        # values no rule mentions get negative ids, so they never match
+        foreign: Dict[Any, int] = {}
+        for key, value in facts.items():
+            attribute_id = self.attributes.ids.get(key)
+            if attribute_id is None:
+                continue
+            present |= 1 << attribute_id
+            try:
+                value_id = self.values.ids.get(value)
+                if value_id is None:
+                    value_id = foreign.setdefault(value, -1 - len(foreign))
+            except TypeError:
+                value_id = -1 - len(foreign)
+                foreign[object()] = value_id
+            state[attribute_id] = value_id
+        return state, present
+
+    def forward_chain(self, facts: Dict[str, Any]) -> Tuple[Dict[str, Any], List[str]]:
+        state, present = self.encode(facts)
+        protected = self.protected
+        cond_attrs, cond_values = self.cond_attrs, self.cond_values
+        then_attrs, then_values = self.then_attrs, self.then_values
+        keys = self.attributes.symbols
+        symbols = self.values.symbols
+        names = self.names.symbols
+
+        fired: List[str] = []
+        # one byte per name: int bitsets copy N/8 bytes per operation
+        fired_names = bytearray(len(names))
+        changed = True
+
+        while changed:
+            changed = False
+
+            for rule in self.rules:
+                name_id = rule.name_id
+                if fired_names[name_id]:
+                    continue
+
+                for position in range(rule.cond_start, rule.cond_stop):
+                    if state[cond_attrs[position]] != cond_values[position]:
+                        break
+                else:
+                    for position in range(rule.then_start, rule.then_stop):
+                        attribute_id, value_id = then_attrs[position], then_values[position]
+                        if state[attribute_id] == value_id:
+                            continue
+                        # Do not overwrite protected keys once set
+                        if (protected & present) >> attribute_id & 1:
+                            continue
+                        state[attribute_id] = value_id
+                        present |= 1 << attribute_id
+                        facts[keys[attribute_id]] = symbols[value_id]
+                        changed = True
+
+                    fired.append(names[name_id])
+                    fired_names[name_id] = 1
+
+        return facts, fired
+
+
+def deep_sizeof(obj: Any, seen: Optional[Set[int]] = None) -> int:
+    # bytes reachable from obj, counting shared objects (interned strings,
+    # small ints) once
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(key, seen) + deep_sizeof(value, seen) for key, value in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_sizeof(item, seen) for item in obj)
+    elif hasattr(obj, "__slots__"):
+        size += sum(deep_sizeof(getattr(obj, slot), seen) for slot in obj.__slots__ if hasattr(obj, slot))
+    return size
+
+
+def memory_report(rules: List[Rule] = RULES, workload: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+    compact = CompactKB(rules)
+    seconds = None
+    if workload:
+        start = time.perf_counter()
+        for facts in workload:
+            compact.forward_chain(dict(facts))
+        seconds = (time.perf_counter() - start) / len(workload)
+    # both forms hold the same key/value/name objects; report them separately
+    # so the structural overhead of each form is visible
+    symbols = compact.attributes.symbols + compact.values.symbols + compact.names.symbols
+    symbol_ids = {id(symbol) for symbol in symbols}
+    dict_bytes = deep_sizeof(rules)
+    compact_bytes = deep_sizeof(compact)
+    return {
+        "rules": len(rules),
+        "symbol_bytes": deep_sizeof(symbols) - sys.getsizeof(symbols),
+        "dict_bytes": dict_bytes,
+        "compact_bytes": compact_bytes,
+        "dict_structure_bytes": deep_sizeof(rules, set(symbol_ids)),
+        "compact_structure_bytes": deep_sizeof(compact, set(symbol_ids)),
+        "seconds_per_diagnosis": seconds,
+    }
+
+
+if __name__ == "__main__":
+    from benchmark import synthetic_kb, synthetic_workload
+    from symptoms import enumerate_symptoms
+
+    for title, rules, workload in (
+        ("kb", RULES, list(enumerate_symptoms())),
+        ("synthetic-100000", synthetic_kb(100000), synthetic_workload(20)),
+    ):
+        print(f"{title}:")
+        for name, value in memory_report(rules, workload).items():
+            print(f"  {name}: {value}")
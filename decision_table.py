@@ -0,0 +1,127 @@
+import argparse
+import json
+import sys
+from typing import Dict, List, Tuple, Any, Iterable, Optional
+
+from kb import RULES, Rule
+from engine import forward_chain, kb_hash
+from cache import canonical_facts
+from symptoms import enumerate_symptoms
+
+
+DEFAULT_PATH = "decision_table.json"
+FORMAT_VERSION = 1
+
+TableEntry = Tuple[Dict[str, Any], Tuple[str, ...]]
+
+
+def build_table(rules: List[Rule] = RULES, inputs: Optional[Iterable[Dict[str, Any]]] = None) -> Dict[str, Any]:
+    name_ids: Dict[str, int] = {}
+    entries: List[Dict[str, Any]] = []
+
+    for facts in enumerate_symptoms() if inputs is None else inputs:
+        final_facts, fired = forward_chain(dict(facts), rules)
+        # store only what reasoning added, in the order the engine added it
+        derived = {key: value for key, value in final_facts.items() if key not in facts or facts[key] != value}
+        entries.append({
+            "facts": facts,
+            "derived": derived,
+            "fired": [name_ids.setdefault(name, len(name_ids)) for name in fired],
+        })
+
+    return {"format": FORMAT_VERSION, "kb_hash": kb_hash(rules), "names": list(name_ids), "entries": entries}
+
+
+def save_table(table: Dict[str, Any], path: str = DEFAULT_PATH) -> None:
+    with open(path, "w", encoding="utf-8") as handle:
+        json.dump(table, handle, separators=(",", ":"))
+
+
+def load_table(path: str = DEFAULT_PATH) -> Dict[str, Any]:
+    with open(path, encoding="utf-8") as handle:
+        return json.load(handle)
+
+
+class TableEngine:
+    """Constant-time diagnosis by lookup in a precomputed decision table.
+
+    Inputs outside the enumerated symptom domain fall back to
+    ``engine.forward_chain``.  Like the engine, ``forward_chain`` updates the
+    given facts dict in place and returns it.
+    """
+
+    def __init__(self, table: Dict[str, Any], rules: List[Rule] = RULES) -> None:
+        if table.get("format") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported decision table format: {table.get('format')!r}")
+        if table.get("kb_hash") != kb_hash(rules):
+            raise ValueError("Decision table was built for a different knowledge base; rebuild it.")
+
+        self.rules = rules
+        self.hits = 0
+        self.fallbacks = 0
+
+        names = table["names"]
+        self._lookup: Dict[Any, TableEntry] = {}
+        for entry in table["entries"]:
+            fired = tuple(names[index] for index in entry["fired"])
+            self._lookup[canonical_facts(entry["facts"])] = (entry["derived"], fired)
+
+    @classmethod
+    def from_file(cls, path: str = DEFAULT_PATH, rules: List[Rule] = RULES) -> "TableEngine":
+        return cls(load_table(path), rules)
+
+    def __len__(self) -> int:
+        return len(self._lookup)
+
+    def forward_chain(self, facts: Dict[str, Any]) -> Tuple[Dict[str, Any], List[str]]:
+        try:
+            entry = self._lookup.get(canonical_facts(facts))
+        except TypeError:
+            entry = None
+
+        if entry is None:
+            self.fallbacks += 1
+            return forward_chain(facts, self.rules)
+
+        self.hits += 1
+        derived, fired = entry
+        facts.update(derived)
+        return facts, list(fired)
+
+
+def verify_table(table: Dict[str, Any], rules: List[Rule] = RULES) -> List[Dict[str, Any]]:
+    engine = TableEngine(table, rules)
+    mismatches = []
+    for entry in table["entries"]:
+        expected = forward_chain(dict(entry["facts"]), rules)
+        actual = engine.forward_chain(dict(entry["facts"]))
+        if actual != expected or list(actual[0]) != list(expected[0]):
+            mismatches.append({"facts": entry["facts"], "expected": expected, "actual": actual})
+    return mismatches
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Build or verify the precomputed diagnosis decision table.")
+    parser.add_argument("command", choices=["build", "verify"])
+    parser.add_argument("-p", "--path", default=DEFAULT_PATH, help=f"table artifact (default {DEFAULT_PATH})")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        table = build_table()
+        save_table(table, args.path)
+        print(f"Wrote {len(table['entries'])} entries to {args.path}")
+        return 0
+
+    try:
+        mismatches = verify_table(load_table(args.path))
+    except ValueError as error:
+        print(error)
+        return 1
+    for mismatch in mismatches:
+        print(json.dumps(mismatch, default=str))
+    print(f"{len(mismatches)} mismatches")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,106 @@
+import argparse
+import sys
+from typing import Dict, List, Any, Optional
+
+from kb import RULES
+from engine import forward_chain
+from symptoms import (
+    AUTH_HEADER_OPTIONS,
+    CLIENT_TYPE_OPTIONS,
+    KEYWORDS_BY_STATUS,
+    RELEVANT_METHOD_BY_STATUS_CODES,
+    STATUS_OPTIONS,
+)
+
+
+RESULT_KEYS = ("diagnosis", "category", "cause", "recommendation")
+
+
+def _read_json(text: str) -> Dict[str, Any]:
+    import json
+
+    source = sys.stdin.read() if text == "-" else text
+    facts = json.loads(source)
+    if not isinstance(facts, dict):
+        raise ValueError("expected a JSON object of facts")
+    return facts
+
+
+def build_facts(args: argparse.Namespace) -> Dict[str, Any]:
+    # JSON first, flags override it
+    facts = _read_json(args.json) if args.json else {}
+    for key, value in (
+        ("status_code", args.status),
+        ("has_auth_header", args.auth_header),
+        ("client_type", args.client_type),
+        ("error_keyword", args.keyword),
+        ("method", args.method),
+    ):
+        if value not in (None, ""):
+            facts[key] = value
+    return facts
+
+
+def diagnose(facts: Dict[str, Any]) -> Dict[str, Any]:
+    final_facts, fired = forward_chain(dict(facts), RULES)
+    result: Dict[str, Any] = {key: final_facts.get(key) for key in RESULT_KEYS}
+    result["facts"] = final_facts
+    result["fired"] = fired
+    return result
+
+
+def format_text(result: Dict[str, Any]) -> str:
+    lines = []
+    if result["diagnosis"]:
+        category = f" ({result['category']})" if result["category"] else ""
+        lines.append(f"Diagnosis{category}: {result['diagnosis']}")
+    else:
+        lines.append("No diagnosis could be inferred with the current information.")
+    if result["cause"]:
+        lines.append(f"Cause: {result['cause']}")
+    if result["recommendation"]:
+        lines.append(f"Recommendation: {result['recommendation']}")
+    lines.append("Rules fired:")
+    lines.extend(f"  - {name}" for name in result["fired"])
+    if not result["fired"]:
+        lines.append("  (none)")
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    statuses = [status for status in STATUS_OPTIONS if status is not None]
+    keywords = sorted({keyword for options in KEYWORDS_BY_STATUS.values() for keyword in options if keyword})
+    methods = sorted({method for options in RELEVANT_METHOD_BY_STATUS_CODES.values() for method in options if method})
+
+    parser = argparse.ArgumentParser(
+        prog="python -m diagnose",
+        description="Diagnose a failed API call from its symptoms. Exits 1 when no diagnosis is found.",
+    )
+    parser.add_argument("-s", "--status", type=int, choices=statuses, metavar="CODE", help=f"HTTP status code ({', '.join(map(str, statuses))})")
+    parser.add_argument("-k", "--keyword", choices=keywords, metavar="KEYWORD", help=f"main error keyword ({', '.join(keywords)})")
+    parser.add_argument("-m", "--method", type=str.upper, choices=methods, metavar="METHOD", help=f"HTTP method ({', '.join(methods)})")
+    parser.add_argument("--auth-header", choices=AUTH_HEADER_OPTIONS, help="was an Authorization header sent")
+    parser.add_argument("--client-type", choices=CLIENT_TYPE_OPTIONS)
+    parser.add_argument("--json", metavar="OBJECT", help="facts as a JSON object, '-' to read it from stdin")
+    parser.add_argument("--format", choices=("text", "json"), default="text")
+    args = parser.parse_args(argv)
+
+    try:
+        facts = build_facts(args)
+    except ValueError as error:
+        parser.error(f"--json: {error}")
+    if not facts:
+        parser.error("no symptoms given; pass --status and friends or --json")
+
+    result = diagnose(facts)
+    if args.format == "json":
+        import json
+
+        print(json.dumps(result, indent=2))
+    else:
+        print(format_text(result))
+    return 0 if result["diagnosis"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
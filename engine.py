@@ -1,19 +1,45 @@
-from typing import Dict, List, Tuple, Any
+from typing import TYPE_CHECKING, Dict, List, Tuple, Any, Callable, Iterable, Optional
 from kb import Rule
 
+# the headless CLI imports this module on every start, so anything only some
+# callers need is imported where it is used
+if TYPE_CHECKING:
+    from instrumentation import Instrumentation
 
-def forward_chain(facts: Dict[str, Any], rules: List[Rule]) -> Tuple[Dict[str, Any], List[str]]:
-    fired: List[str] = []
-    changed = True
 
-    PROTECTED_KEYS = {"category", "cause", "diagnosis", "recommendation"}
+PROTECTED_KEYS = frozenset({"category", "cause", "diagnosis", "recommendation"})
+
 
+def rule_sort_key(rule: Rule) -> Tuple[int, int]:
+    return len(rule.get("if", {})), rule.get("priority", 0)
+
+
+def sort_rules(rules: List[Rule]) -> List[Rule]:
     # sort rules by number of conditions and priority
-    sorted_rules = sorted(
-        rules,
-        key=lambda r: (len(r.get("if", {})), r.get("priority", 0)),
-        reverse=True,
-    )
+    return sorted(rules, key=rule_sort_key, reverse=True)
+
+
+def kb_hash(rules: List[Rule]) -> str:
+    # stable across processes, unlike hash(); changes whenever any rule does
+    import hashlib
+    import json
+
+    payload = json.dumps(rules, sort_keys=True, default=repr)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def forward_chain(
+    facts: Dict[str, Any],
+    rules: List[Rule],
+    instrumentation: Optional["Instrumentation"] = None,
+) -> Tuple[Dict[str, Any], List[str]]:
+    if instrumentation is not None:
+        return _forward_chain_instrumented(facts, rules, instrumentation)
+
+    fired: List[str] = []
+    changed = True
+
+    sorted_rules = sort_rules(rules)
 
     while changed:
         changed = False
@@ -43,3 +69,88 @@ def forward_chain(facts: Dict[str, Any], rules: List[Rule]) -> Tuple[Dict[str, A
                     changed = True
 
     return facts, fired
+
+
+def _forward_chain_instrumented(
+    facts: Dict[str, Any],
+    rules: List[Rule],
+    instrumentation: "Instrumentation",
+) -> Tuple[Dict[str, Any], List[str]]:
+    # same loop as forward_chain, kept separate so the plain path pays nothing
+    import time
+
+    clock = time.perf_counter_ns
+    on_match, on_fire, on_pass = instrumentation.on_match, instrumentation.on_fire, instrumentation.on_pass
+    fired: List[str] = []
+    changed = True
+    pass_number = 0
+
+    sorted_rules = sort_rules(rules)
+    instrumentation.runs += 1
+
+    while changed:
+        changed = False
+        pass_number += 1
+
+        for rule in sorted_rules:
+            name = rule.get("name", "<unnamed>")
+            if name in fired:
+                continue
+
+            stats = instrumentation.rule(name)
+            conditions = rule.get("if", {})
+            start = clock()
+            matched = all(facts.get(key) == value for key, value in conditions.items())
+            stats.match_ns += clock() - start
+            stats.tests += 1
+            if not matched:
+                continue
+
+            if on_match is not None:
+                on_match(rule, facts)
+            start = clock()
+            then_part = rule.get("then", {})
+            updated = False
+
+            for key, value in then_part.items():
+                # Do not overwrite protected keys once set
+                if key in PROTECTED_KEYS and key in facts and facts.get(key) != value:
+                    continue
+
+                if facts.get(key) != value:
+                    facts[key] = value
+                    updated = True
+
+            fired.append(name)
+            stats.fire_ns += clock() - start
+            stats.fires += 1
+            stats.updates += updated
+            if on_fire is not None:
+                on_fire(rule, facts, updated)
+
+            if updated:
+                changed = True
+
+        instrumentation.passes += 1
+        if on_pass is not None:
+            on_pass(pass_number, changed)
+
+    instrumentation.last_passes = pass_number
+    return facts, fired
+
+
+def differential_check(
+    candidate: Callable[[Dict[str, Any]], Tuple[Dict[str, Any], List[str]]],
+    rules: List[Rule],
+    inputs: Iterable[Dict[str, Any]],
+) -> List[Dict[str, Any]]:
+    # compares another engine against forward_chain, including fact key order
+    import copy
+
+    mismatches = []
+    for facts in inputs:
+        expected = forward_chain(copy.deepcopy(facts), rules)
+        actual = tuple(candidate(copy.deepcopy(facts)))
+        if actual != expected or list(actual[0]) != list(expected[0]):
+            mismatches.append({"facts": facts, "expected": expected, "actual": actual})
+    return mismatches
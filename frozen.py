@@ -0,0 +1,242 @@
+import argparse
+import copy
+import sys
+import threading
+import time
+from collections.abc import Mapping, MutableMapping
+from types import MappingProxyType
+from typing import Dict, List, Tuple, Any, Iterator, NamedTuple, Optional
+
+from kb import RULES, Rule
+from engine import PROTECTED_KEYS, differential_check, forward_chain, kb_hash, sort_rules
+from symptoms import exhaustive_symptoms
+
+
+_MISSING = object()
+
+
+class _Deleted:
+    __slots__ = ()
+
+    def __repr__(self) -> str:
+        return "<deleted>"
+
+
+_DELETED = _Deleted()
+
+
+class OverlayFacts(MutableMapping):
+    """Copy-on-write view of facts layered over a shared base mapping.
+
+    Reads fall through to ``base`` unless the key was written (or deleted)
+    in this layer; writes only ever touch the layer, so any number of
+    overlays can share one base (or stack on each other) without copying it.
+    Iteration follows dict semantics: base keys in place, new keys after
+    them in the order they were first set.
+    """
+
+    __slots__ = ("base", "local", "_added")
+
+    def __init__(self, base: Optional[Mapping] = None, local: Optional[Dict[str, Any]] = None) -> None:
+        self.base = MappingProxyType({}) if base is None else base
+        self.local: Dict[str, Any] = {} if local is None else local
+        self._added = [key for key in self.local if key not in self.base]
+
+    def __getitem__(self, key: str) -> Any:
+        value = self.local.get(key, _MISSING)
+        if value is _MISSING:
+            return self.base[key]
+        if value is _DELETED:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        if key not in self.base and key not in self.local:
+            self._added.append(key)
+        self.local[key] = value
+
+    def __delitem__(self, key: str) -> None:
+        if key not in self:
+            raise KeyError(key)
+        if key in self.base:
+            self.local[key] = _DELETED
+        else:
+            del self.local[key]
+        if key in self._added:
+            self._added.remove(key)
+
+    def __contains__(self, key: object) -> bool:
+        value = self.local.get(key, _MISSING)
+        if value is _MISSING:
+            return key in self.base
+        return value is not _DELETED
+
+    def __iter__(self) -> Iterator[str]:
+        for key in self.base:
+            if self.local.get(key, _MISSING) is not _DELETED:
+                yield key
+        yield from self._added
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __repr__(self) -> str:
+        return f"OverlayFacts({self.to_dict()!r})"
+
+    @property
+    def derived(self) -> Dict[str, Any]:
+        # what this layer changed relative to its base
+        return {key: value for key, value in self.local.items() if value is not _DELETED}
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {key: self[key] for key in self}
+
+
+class FrozenRule(NamedTuple):
+    name: str
+    conditions: Tuple[Tuple[str, Any], ...]
+    actions: Tuple[Tuple[str, Any], ...]
+
+
+class FrozenKB:
+    """Immutable, pre-sorted rules that can be shared freely across threads.
+
+    Rules are deep-copied into tuples once, in ``engine.forward_chain``
+    order, and the object rejects attribute assignment afterwards.  A run
+    keeps all of its state in locals and writes derivations to a fresh
+    ``OverlayFacts`` over the caller's facts, which are only read, so
+    concurrent runs need no locks, on free-threaded builds as well.
+    """
+
+    __slots__ = ("rules", "version", "_protected")
+
+    def __init__(self, rules: List[Rule] = RULES) -> None:
+        frozen = tuple(
+            FrozenRule(
+                rule.get("name", "<unnamed>"),
+                tuple(copy.deepcopy(rule.get("if", {})).items()),
+                tuple(copy.deepcopy(rule.get("then", {})).items()),
+            )
+            for rule in sort_rules(rules)
+        )
+        object.__setattr__(self, "rules", frozen)
+        object.__setattr__(self, "version", kb_hash(rules))
+        object.__setattr__(self, "_protected", PROTECTED_KEYS)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __delattr__(self, name: str) -> None:
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __len__(self) -> int:
+        return len(self.rules)
+
+    def run(self, facts: Mapping) -> Tuple[OverlayFacts, Tuple[str, ...]]:
+        local: Dict[str, Any] = {}
+        base_get = facts.get
+        protected = self._protected
+        fired: List[str] = []
+        fired_names = set()
+        changed = True
+
+        while changed:
+            changed = False
+
+            for name, conditions, actions in self.rules:
+                if name in fired_names:
+                    continue
+                for key, value in conditions:
+                    if (local[key] if key in local else base_get(key)) != value:
+                        break
+                else:
+                    for key, value in actions:
+                        current = local[key] if key in local else base_get(key, _MISSING)
+                        # Do not overwrite protected keys once set
+                        if key in protected and current is not _MISSING and current != value:
+                            continue
+                        if (None if current is _MISSING else current) != value:
+                            local[key] = value
+                            changed = True
+                    fired.append(name)
+                    fired_names.add(name)
+
+        return OverlayFacts(facts, local), tuple(fired)
+
+    def forward_chain(self, facts: Mapping) -> Tuple[Dict[str, Any], List[str]]:
+        # same result as engine.forward_chain, without touching facts
+        overlay, fired = self.run(facts)
+        return overlay.to_dict(), list(fired)
+
+
+def scaling_benchmark(
+    threads: List[int],
+    requests: int = 20000,
+    rules: List[Rule] = RULES,
+) -> List[Dict[str, Any]]:
+    # wall-clock throughput of one shared KB used by N threads at once,
+    # against engine.forward_chain (which re-sorts the rules per call)
+    from benchmark import realistic_workload
+
+    workload = realistic_workload(requests)
+    kb = FrozenKB(rules)
+    engines = {
+        "forward_chain": lambda facts: forward_chain(dict(facts), rules),
+        "frozen": kb.run,
+    }
+
+    results = []
+    for name, engine in engines.items():
+        single = None
+        for count in threads:
+            shares = [workload[start::count] for start in range(count)]
+            barrier = threading.Barrier(count + 1)
+
+            def work(share: List[Dict[str, Any]]) -> None:
+                barrier.wait()
+                for facts in share:
+                    engine(facts)
+
+            workers = [threading.Thread(target=work, args=(share,)) for share in shares]
+            for worker in workers:
+                worker.start()
+            barrier.wait()
+            start = time.perf_counter()
+            for worker in workers:
+                worker.join()
+            elapsed = time.perf_counter() - start
+
+            throughput = len(workload) / elapsed
+            single = single or throughput
+            results.append({
+                "engine": name,
+                "threads": count,
+                "throughput": throughput,
+                "speedup": throughput / single,
+            })
+    return results
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Check FrozenKB and measure multi-threaded scaling.")
+    parser.add_argument("--verify", action="store_true", help="compare against forward_chain on every input combination")
+    parser.add_argument("--threads", default="1,2,4,8")
+    parser.add_argument("--requests", type=int, default=20000)
+    args = parser.parse_args(argv)
+
+    if args.verify:
+        kb = FrozenKB()
+        mismatches = differential_check(kb.forward_chain, RULES, exhaustive_symptoms(RULES))
+        print(f"{len(mismatches)} mismatches")
+        if mismatches:
+            return 1
+
+    gil = getattr(sys, "_is_gil_enabled", lambda: True)()
+    print(f"Python {sys.version.split()[0]}, GIL {'enabled' if gil else 'disabled'}")
+    for row in scaling_benchmark([int(count) for count in args.threads.split(",")], args.requests):
+        print(f"{row['engine']:<14} {row['threads']:>3} threads  {row['throughput']:>10.0f}/s  x{row['speedup']:.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,108 @@
+import json
+from typing import Dict, List, Any, Callable, Optional
+
+from kb import Rule
+
+
+MatchHook = Callable[[Rule, Dict[str, Any]], None]
+FireHook = Callable[[Rule, Dict[str, Any], bool], None]
+PassHook = Callable[[int, bool], None]
+
+
+class RuleStats:
+    __slots__ = ("tests", "fires", "updates", "match_ns", "fire_ns")
+
+    def __init__(self) -> None:
+        self.tests = 0
+        self.fires = 0
+        self.updates = 0
+        self.match_ns = 0
+        self.fire_ns = 0
+
+    def as_dict(self) -> Dict[str, int]:
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+
+class Instrumentation:
+    """Counters, timings and hooks for ``engine.forward_chain``.
+
+    Pass one as ``forward_chain(facts, rules, instrumentation)``; it
+    accumulates over every run it is passed to.  ``on_match(rule, facts)`` is
+    called when a rule's conditions hold, ``on_fire(rule, facts, updated)``
+    after its actions were applied and ``on_pass(pass_number, changed)`` at
+    the end of each pass.  Not thread-safe: use one per thread.
+    """
+
+    def __init__(
+        self,
+        on_match: Optional[MatchHook] = None,
+        on_fire: Optional[FireHook] = None,
+        on_pass: Optional[PassHook] = None,
+    ) -> None:
+        self.on_match = on_match
+        self.on_fire = on_fire
+        self.on_pass = on_pass
+        self.reset()
+
+    def reset(self) -> None:
+        self.runs = 0
+        self.passes = 0
+        self.last_passes = 0
+        self.rules: Dict[str, RuleStats] = {}
+
+    def rule(self, name: str) -> RuleStats:
+        stats = self.rules.get(name)
+        if stats is None:
+            stats = self.rules[name] = RuleStats()
+        return stats
+
+    @property
+    def tests(self) -> int:
+        return sum(stats.tests for stats in self.rules.values())
+
+    def hottest(self, limit: int = 10, by: str = "tests") -> List[Dict[str, Any]]:
+        ranked = sorted(self.rules.items(), key=lambda item: getattr(item[1], by), reverse=True)
+        return [{"rule": name, **stats.as_dict()} for name, stats in ranked[:limit]]
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "runs": self.runs,
+            "passes": self.passes,
+            "tests": self.tests,
+            "rules": {name: stats.as_dict() for name, stats in self.rules.items()},
+        }
+
+
+def to_json(instrumentation: Instrumentation, indent: Optional[int] = None) -> str:
+    return json.dumps(instrumentation.as_dict(), indent=indent)
+
+
+def _label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def to_prometheus(instrumentation: Instrumentation, prefix: str = "rule_engine") -> str:
+    # Prometheus text exposition format, all series are counters
+    lines: List[str] = []
+
+    def counter(name: str, help_text: str, samples: List[str]) -> None:
+        lines.append(f"# HELP {prefix}_{name} {help_text}")
+        lines.append(f"# TYPE {prefix}_{name} counter")
+        lines.extend(samples)
+
+    counter("runs_total", "Forward chaining runs.", [f"{prefix}_runs_total {instrumentation.runs}"])
+    counter("passes_total", "Passes over the rule list.", [f"{prefix}_passes_total {instrumentation.passes}"])
+
+    per_rule = (
+        ("rule_tests_total", "Condition tests per rule.", lambda stats: stats.tests),
+        ("rule_fires_total", "Firings per rule.", lambda stats: stats.fires),
+        ("rule_updates_total", "Firings per rule that changed a fact.", lambda stats: stats.updates),
+        ("rule_match_seconds_total", "Time spent testing each rule's conditions.", lambda stats: stats.match_ns / 1e9),
+        ("rule_fire_seconds_total", "Time spent applying each rule's actions.", lambda stats: stats.fire_ns / 1e9),
+    )
+    for name, help_text, value in per_rule:
+        counter(name, help_text, [
+            f"{prefix}_{name}{{rule=\"{_label(rule)}\"}} {value(stats)}"
+            for rule, stats in instrumentation.rules.items()
+        ])
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,335 @@
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import sys
+import tempfile
+import threading
+from typing import Dict, List, Tuple, Any, Iterable, NamedTuple, Optional
+
+from kb import RULES, Rule
+from engine import kb_hash
+from rete import ReteNetwork
+
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".rulecache")
+CACHE_FORMAT = 3
+# modules whose code decides what a compiled network looks like
+COMPILER_SOURCES = ("engine.py", "rete.py")
+
+EXTENSIONS = (".json", ".yaml", ".yml", ".toml")
+RULE_FIELDS = {"name", "priority", "if", "then"}
+SCALAR_TYPES = (str, int, float, bool, type(None))
+
+
+class RuleFileError(ValueError):
+    def __init__(self, problems: List[str]) -> None:
+        self.problems = problems
+        super().__init__("Invalid rule files:\n  " + "\n  ".join(problems))
+
+
+class CompiledKB(NamedTuple):
+    version: str
+    sources: Tuple[str, ...]
+    rules: List[Rule]
+    network: ReteNetwork
+
+
+def _parse(path: str, data: bytes) -> Any:
+    # every parser's errors come out as RuleFileError, so a half-edited file
+    # is reported like any other invalid rule file
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".json":
+        try:
+            return json.loads(data.decode("utf-8"))
+        except ValueError as error:
+            raise RuleFileError([f"{path}: {error}"]) from None
+    if extension in (".yaml", ".yml"):
+        try:
+            import yaml
+        except ImportError:
+            raise RuleFileError([f"{path}: PyYAML is required to load YAML rule files"]) from None
+        try:
+            return yaml.safe_load(data)
+        except yaml.YAMLError as error:
+            raise RuleFileError([f"{path}: {error}"]) from None
+    if extension == ".toml":
+        try:
+            import tomllib
+        except ImportError:
+            try:
+                import tomli as tomllib
+            except ImportError:
+                raise RuleFileError([f"{path}: tomli is required to load TOML rule files before Python 3.11"]) from None
+        try:
+            return tomllib.loads(data.decode("utf-8"))
+        except ValueError as error:
+            raise RuleFileError([f"{path}: {error}"]) from None
+    raise RuleFileError([f"{path}: unsupported rule file type (expected one of {', '.join(EXTENSIONS)})"])
+
+
+def validate_rules(rules: Any, source: str) -> List[str]:
+    # a rule file holds a list of rules, or a mapping with a "rules" list
+    # (the only form TOML allows)
+    if isinstance(rules, dict) and set(rules) == {"rules"}:
+        rules = rules["rules"]
+    if not isinstance(rules, list):
+        return [f"{source}: expected a list of rules or a mapping with a 'rules' list"]
+
+    problems = []
+    for position, rule in enumerate(rules):
+        where = f"{source}: rule #{position + 1}"
+        if not isinstance(rule, dict):
+            problems.append(f"{where}: expected a mapping")
+            continue
+        if isinstance(rule.get("name"), str) and rule["name"]:
+            where = f"{source}: rule {rule['name']!r}"
+        else:
+            problems.append(f"{where}: 'name' must be a non-empty string")
+
+        unknown = set(rule) - RULE_FIELDS
+        if unknown:
+            problems.append(f"{where}: unknown fields {', '.join(sorted(unknown))}")
+        priority = rule.get("priority", 0)
+        if not isinstance(priority, int) or isinstance(priority, bool):
+            problems.append(f"{where}: 'priority' must be an integer")
+        for part, required in (("if", False), ("then", True)):
+            mapping = rule.get(part, {})
+            if not isinstance(mapping, dict) or (required and not mapping):
+                problems.append(f"{where}: '{part}' must be a {'non-empty ' if required else ''}mapping")
+                continue
+            for key, value in mapping.items():
+                if not isinstance(key, str) or not isinstance(value, SCALAR_TYPES):
+                    problems.append(f"{where}: '{part}' entry {key!r} must map a string to a scalar value")
+    return problems
+
+
+def _source_files(paths: Iterable[str]) -> List[str]:
+    # directories contribute their rule files in name order
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(
+                os.path.join(path, name) for name in sorted(os.listdir(path))
+                if os.path.splitext(name)[1].lower() in EXTENSIONS
+            )
+        else:
+            files.append(path)
+    return files
+
+
+def load_rules(paths: Iterable[str]) -> List[Rule]:
+    return _load(_source_files(paths), [])
+
+
+def _load(files: List[str], contents: List[bytes]) -> List[Rule]:
+    rules: List[Rule] = []
+    problems: List[str] = []
+    defined: Dict[str, str] = {}
+    for position, path in enumerate(files):
+        if position < len(contents):
+            data = contents[position]
+        else:
+            with open(path, "rb") as handle:
+                data = handle.read()
+        try:
+            parsed = _parse(path, data)
+        except RuleFileError as error:
+            problems.extend(error.problems)
+            continue
+
+        found = validate_rules(parsed, path)
+        if found:
+            problems.extend(found)
+            continue
+        for rule in parsed["rules"] if isinstance(parsed, dict) else parsed:
+            name = rule["name"]
+            if name in defined:
+                problems.append(f"{path}: rule {name!r} is already defined in {defined[name]}")
+                continue
+            defined[name] = path
+            rules.append({"name": name, "priority": rule.get("priority", 0), "if": dict(rule.get("if", {})), "then": dict(rule["then"])})
+
+    if problems:
+        raise RuleFileError(problems)
+    return rules
+
+
+def _compiler_hash() -> str:
+    digest = hashlib.sha256()
+    for name in COMPILER_SOURCES:
+        with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), name), "rb") as handle:
+            digest.update(hashlib.sha256(handle.read()).digest())
+    return digest.hexdigest()
+
+
+def compile_files(paths: Iterable[str], cache_dir: Optional[str] = DEFAULT_CACHE_DIR) -> CompiledKB:
+    """Validated, merged rules of the given files plus their Rete network.
+
+    The rules, their version hash and the network's tables are pickled under
+    ``cache_dir`` keyed on the files' paths and content hashes, so a process
+    starting on unchanged files skips parsing, validation, hashing and
+    compiling.  Entries record a hash of the compiling code and are rebuilt
+    once it changes.
+    """
+    files = _source_files(paths)
+    contents = []
+    digest = hashlib.sha256(f"{CACHE_FORMAT}".encode("utf-8"))
+    for path in files:
+        with open(path, "rb") as handle:
+            data = handle.read()
+        contents.append(data)
+        digest.update(os.path.abspath(path).encode("utf-8") + b"\0" + hashlib.sha256(data).digest())
+    cache_path = None if cache_dir is None else os.path.join(cache_dir, f"rules_{digest.hexdigest()[:16]}.pickle")
+
+    compiler = _compiler_hash()
+    if cache_path is not None and os.path.exists(cache_path):
+        try:
+            with open(cache_path, "rb") as handle:
+                cached = pickle.load(handle)
+            if cached.get("format") == CACHE_FORMAT and cached.get("compiler") == compiler:
+                network = ReteNetwork.from_tables(cached["network"])
+                return CompiledKB(cached["version"], tuple(files), cached["rules"], network)
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError, TypeError, KeyError):
+            pass
+
+    rules = _load(files, contents)
+    compiled = CompiledKB(kb_hash(rules), tuple(files), rules, ReteNetwork(rules))
+    if cache_path is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        handle, temporary = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+        with os.fdopen(handle, "wb") as output:
+            pickle.dump({
+                "format": CACHE_FORMAT,
+                "compiler": compiler,
+                "version": compiled.version,
+                "rules": rules,
+                "network": compiled.network.tables(),
+            }, output, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary, cache_path)
+    return compiled
+
+
+class ReloadingKB:
+    """A compiled KB loaded from rule files, swapped in when they change.
+
+    ``forward_chain`` reads the current ``CompiledKB`` once and runs on it, so
+    a reload never waits for or disturbs in-flight diagnoses: they finish on
+    the KB they started with while new ones pick up the replacement.  A
+    reload that fails (e.g. a half-edited file) keeps the current KB and
+    records the error in ``last_error``.
+    """
+
+    def __init__(self, paths: Iterable[str], cache_dir: Optional[str] = DEFAULT_CACHE_DIR, interval: float = 1.0) -> None:
+        self.paths = list(paths)
+        self.cache_dir = cache_dir
+        self.interval = interval
+        self.last_error: Optional[Exception] = None
+        self.reloads = 0
+        self._stamp = self._stat()
+        self.current = compile_files(self.paths, cache_dir)
+        self._reload_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _stat(self) -> Tuple[Tuple[str, int, int], ...]:
+        stamp = []
+        for path in _source_files(self.paths):
+            try:
+                info = os.stat(path)
+                stamp.append((path, info.st_mtime_ns, info.st_size))
+            except OSError:
+                stamp.append((path, -1, -1))
+        return tuple(stamp)
+
+    @property
+    def rules(self) -> List[Rule]:
+        return self.current.rules
+
+    def forward_chain(self, facts: Dict[str, Any]) -> Tuple[Dict[str, Any], List[str]]:
+        return self.current.network.forward_chain(facts)
+
+    def reload(self, force: bool = False) -> bool:
+        # True when a new KB was swapped in
+        with self._reload_lock:
+            stamp = self._stat()
+            if stamp == self._stamp and not force:
+                return False
+            self._stamp = stamp
+            try:
+                compiled = compile_files(self.paths, self.cache_dir)
+            except (OSError, RuleFileError) as error:
+                self.last_error = error
+                return False
+            self.last_error = None
+            if compiled.version == self.current.version:
+                return False
+            self.current = compiled
+            self.reloads += 1
+            return True
+
+    def _watch(self) -> None:
+        while not self._stop.wait(self.interval):
+            # the watcher must outlive any bad edit, or hot reload stops for good
+            try:
+                self.reload()
+            except Exception as error:
+                self.last_error = error
+
+    def start(self) -> "ReloadingKB":
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._watch, name="rule-file-watcher", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self) -> "ReloadingKB":
+        return self.start()
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.stop()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Validate, compile or export rule files.")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    check = subcommands.add_parser("check", help="validate and merge rule files")
+    check.add_argument("paths", nargs="+")
+    build = subcommands.add_parser("build", help="validate rule files and write the compiled cache")
+    build.add_argument("paths", nargs="+")
+    build.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR)
+    export = subcommands.add_parser("export", help="write kb.RULES as a JSON rule file")
+    export.add_argument("output", nargs="?", default="-")
+    args = parser.parse_args(argv)
+
+    if args.command == "export":
+        text = json.dumps(RULES, indent=2) + "\n"
+        if args.output == "-":
+            sys.stdout.write(text)
+        else:
+            with open(args.output, "w", encoding="utf-8") as output:
+                output.write(text)
+        return 0
+
+    try:
+        if args.command == "check":
+            rules = load_rules(args.paths)
+            print(f"{len(rules)} rules OK ({kb_hash(rules)[:16]})")
+        else:
+            compiled = compile_files(args.paths, args.cache_dir)
+            print(f"Compiled {len(compiled.rules)} rules from {len(compiled.sources)} files ({compiled.version[:16]})")
+    except RuleFileError as error:
+        print(error, file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
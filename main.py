@@ -4,27 +4,25 @@ import streamlit as st
 
 from kb import RULES
 from engine import forward_chain
+from instrumentation import Instrumentation
+from ranking import PartialMatcher
+from backward import BackwardChainer
+from symptoms import (
+    AUTH_HEADER_OPTIONS,
+    CLIENT_TYPE_OPTIONS,
+    KEYWORDS_BY_STATUS,
+    RELEVANT_METHOD_BY_STATUS_CODES,
+    STATUS_OPTIONS,
+)
 
 
-KEYWORDS_BY_STATUS: Dict[int, list[str]] = {
-    400: ["", "json", "missing_field", "type", "validation", "empty", "size", "query"],
-    401: ["", "expired", "malformed", "signature", "revoked", "api_key", "scheme"],
-    403: ["", "role", "scope", "policy", "ip"],
-    404: ["", "version", "resource", "slash", "deprecated"],
-    500: ["", "null", "config", "timeout", "db_connection", "memory"],
-    503: ["", "circuit"],
-}
+# only ask for inputs that can still change the recommendation
+CHAINER = BackwardChainer(RULES)
+MATCHER = PartialMatcher(RULES)
 
-STATUS_OPTIONS = [None, 400, 401, 403, 404, 405, 415, 429, 500, 502, 503, 504]
 
-RELEVANT_METHOD_BY_STATUS_CODES: Dict[int, list[str]] = {
-    400: ["", "GET", "POST", "PUT", "PATCH", "DELETE"],
-    403: ["", "GET", "POST", "PUT", "PATCH", "DELETE"],
-    404: ["", "GET", "POST", "PUT", "PATCH", "DELETE"],
-    405: ["", "GET", "POST", "PUT", "PATCH", "DELETE"],
-    415: ["", "POST", "PUT", "PATCH"],
-    429: ["", "GET", "POST", "PUT", "PATCH", "DELETE"],
-}
+def needed(facts: Dict[str, Any]) -> Dict[str, Any]:
+    return CHAINER.needed_inputs("recommendation", facts)
 
 
 def main() -> None:
@@ -44,28 +42,29 @@ def main() -> None:
 
     facts: Dict[str, Any] = {"status_code": status_code}
 
-    if status_code == 401:
+    if "has_auth_header" in needed(facts):
         facts["has_auth_header"] = st.selectbox(
             "Authorization header present?",
-            options=["yes", "no"],
+            options=AUTH_HEADER_OPTIONS,
         )
 
-    if status_code in (403, 429):
+    if "client_type" in needed(facts):
         facts["client_type"] = st.selectbox(
             "Client type",
-            options=["public_api", "internal_service"],
+            options=CLIENT_TYPE_OPTIONS,
         )
 
-    keyword_options = KEYWORDS_BY_STATUS.get(status_code, [""])
-    error_keyword = st.selectbox(
-        "Main error keyword (optional)",
-        options=keyword_options,
-    )
-    if error_keyword:
-        facts["error_keyword"] = error_keyword
+    if "error_keyword" in needed(facts):
+        keyword_options = KEYWORDS_BY_STATUS.get(status_code, [""])
+        error_keyword = st.selectbox(
+            "Main error keyword (optional)",
+            options=keyword_options,
+        )
+        if error_keyword:
+            facts["error_keyword"] = error_keyword
 
     method_options = RELEVANT_METHOD_BY_STATUS_CODES.get(status_code)
-    if method_options is not None:
+    if method_options is not None and "method" in needed(facts):
         method = st.selectbox(
             "HTTP method (optional)",
             options=method_options,
@@ -79,7 +78,8 @@ def main() -> None:
         st.markdown("**Initial facts**")
         st.json(facts)
 
-        final_facts, fired_rules = forward_chain(facts, RULES)
+        instrumentation = Instrumentation()
+        final_facts, fired_rules = forward_chain(facts, RULES, instrumentation)
 
         st.markdown("**Facts after reasoning**")
         st.json(final_facts)
@@ -108,6 +108,20 @@ def main() -> None:
         else:
             st.write("No recommendation could be inferred for the inferred cause.")
 
+        candidates = [
+            candidate
+            for candidate in MATCHER.rank(facts, k=4)
+            if candidate.rule not in fired_rules
+        ][:3]
+        if candidates:
+            st.subheader("Other Candidate Diagnoses")
+            for candidate in candidates:
+                missing = ", ".join(f"`{key}` = `{value}`" for key, value in candidate.missing.items())
+                st.write(
+                    f"- **{candidate.diagnosis}** ({candidate.satisfied}/{candidate.total} conditions met)"
+                    + (f" - would also need {missing}" if missing else "")
+                )
+
         st.subheader("Explanation (Rules Fired)")
         if fired_rules:
             for name in fired_rules:
@@ -115,6 +129,23 @@ def main() -> None:
         else:
             st.write("No rules were fired.")
 
+        with st.expander("Engine profile"):
+            st.write(
+                f"{instrumentation.last_passes} passes, "
+                f"{instrumentation.tests} condition tests over {len(instrumentation.rules)} rules"
+            )
+            st.markdown("**Hottest rules**")
+            st.table([
+                {
+                    "rule": row["rule"],
+                    "tests": row["tests"],
+                    "fired": row["fires"],
+                    "match (us)": round(row["match_ns"] / 1e3, 1),
+                    "fire (us)": round(row["fire_ns"] / 1e3, 1),
+                }
+                for row in instrumentation.hottest(10, by="match_ns")
+            ])
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,90 @@
+import json
+import os
+from typing import Dict, Any
+
+import streamlit as st
+
+from aggregation import WINDOWS, CauseAggregator
+
+
+WINDOW_LABELS = {60: "Last minute", 300: "Last 5 minutes", 3600: "Last hour"}
+
+
+def follow(path: str) -> CauseAggregator:
+    # keep one aggregator per file in the session and feed it only the lines
+    # appended since the last rerun
+    state = st.session_state.get("live_causes")
+    if state is None or state["path"] != path:
+        state = st.session_state["live_causes"] = {"path": path, "offset": 0, "aggregator": CauseAggregator()}
+    if os.path.getsize(path) < state["offset"]:
+        # truncated or rotated
+        state["offset"], state["aggregator"] = 0, CauseAggregator()
+    with open(path, "rb") as source:
+        source.seek(state["offset"])
+        for line in source:
+            if not line.endswith(b"\n"):
+                break
+            state["offset"] += len(line)
+            add(state["aggregator"], line)
+    return state["aggregator"]
+
+
+def add(aggregator: CauseAggregator, line: bytes) -> None:
+    try:
+        result: Dict[str, Any] = json.loads(line)
+    except ValueError:
+        return
+    if isinstance(result, dict) and "fired" in result:
+        aggregator.add(result)
+
+
+def main() -> None:
+    st.title("Live Causes")
+    st.write("Top diagnosed causes over sliding windows of a `streaming.py` diagnoses file.")
+
+    path = st.text_input("Diagnoses file (JSONL)", value="diagnoses.jsonl")
+    upload = st.file_uploader("...or upload one", type=["jsonl", "json"])
+
+    if upload is not None:
+        aggregator = CauseAggregator()
+        for line in upload.getvalue().splitlines():
+            add(aggregator, line)
+    elif path and os.path.isfile(path):
+        aggregator = follow(path)
+    else:
+        st.info("Enter the path of a diagnoses file or upload one.")
+        return
+
+    if not aggregator.events:
+        st.info("No diagnoses yet.")
+        return
+    # windows are anchored at the newest event, so replayed files still show
+    aggregator.advance(aggregator.latest)
+
+    window = st.radio("Window", options=WINDOWS, format_func=lambda span: WINDOW_LABELS.get(span, f"{span}s"), horizontal=True)
+    top = st.slider("Show top", min_value=3, max_value=25, value=10)
+    st.caption(f"{aggregator.events} diagnoses read")
+    if st.button("Refresh"):
+        st.rerun()
+
+    causes, categories = st.columns(2)
+    with causes:
+        st.subheader("Causes")
+        st.table([{"cause": cause, "count": count} for cause, count in aggregator.top("cause", window, top)])
+    with categories:
+        st.subheader("Categories")
+        st.table([{"category": category, "count": count} for category, count in aggregator.top("category", window, top)])
+
+    endpoints = aggregator.top("endpoint", window, top)
+    st.subheader("Endpoints")
+    st.table([{"endpoint": endpoint, "count": count} for endpoint, count in endpoints])
+
+    if endpoints:
+        endpoint = st.selectbox("Causes for endpoint", options=[endpoint for endpoint, _ in endpoints])
+        st.table([
+            {"cause": cause, "count": count}
+            for cause, count in aggregator.top("cause", window, top, endpoint=endpoint)
+        ])
+
+
+main()
@@ -0,0 +1,87 @@
+import os
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from itertools import islice
+from typing import Deque, Dict, List, Tuple, Any, Iterable, Iterator, Optional
+
+from kb import RULES, Rule
+from rete import ReteNetwork
+
+
+Result = Tuple[Dict[str, Any], List[str]]
+
+# compiled network of the current worker process, set once by _init_worker
+_network: Optional[ReteNetwork] = None
+
+
+def _init_worker(network: ReteNetwork) -> None:
+    global _network
+    _network = network
+
+
+def _diagnose_chunk(chunk: List[Dict[str, Any]]) -> List[Result]:
+    return [_network.forward_chain(facts) for facts in chunk]
+
+
+def _chunks(items: Iterable[Dict[str, Any]], size: int) -> Iterator[List[Dict[str, Any]]]:
+    iterator = iter(items)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+class ParallelDiagnoser:
+    """Runs the Rete network over chunks of fact dicts in a process pool.
+
+    The network is compiled in the parent and handed to each worker once, via
+    the pool initializer.  Results are yielded in input order and at most
+    ``max_pending`` chunks are in flight, so arbitrarily long inputs can be
+    streamed through.  Workers return new dicts; the input facts are not
+    mutated.
+    """
+
+    def __init__(
+        self,
+        rules: List[Rule] = RULES,
+        workers: Optional[int] = None,
+        chunk_size: int = 256,
+        max_pending: Optional[int] = None,
+    ) -> None:
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be at least 1")
+        self.network = ReteNetwork(rules)
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self.max_pending = max_pending or 2 * self.workers
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=_init_worker,
+            initargs=(self.network,),
+        )
+
+    def map(self, facts: Iterable[Dict[str, Any]]) -> Iterator[Result]:
+        pending: Deque[Future] = deque()
+        for chunk in _chunks(facts, self.chunk_size):
+            pending.append(self._executor.submit(_diagnose_chunk, chunk))
+            if len(pending) >= self.max_pending:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+    def close(self) -> None:
+        self._executor.shutdown()
+
+    def __enter__(self) -> "ParallelDiagnoser":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+
+def forward_chain_parallel(
+    batch: Iterable[Dict[str, Any]],
+    rules: List[Rule] = RULES,
+    workers: Optional[int] = None,
+    chunk_size: int = 256,
+) -> List[Result]:
+    with ParallelDiagnoser(rules, workers, chunk_size) as diagnoser:
+        return list(diagnoser.map(batch))
@@ -0,0 +1,231 @@
+import sys
+import time
+from bisect import bisect_right
+from heapq import merge
+from typing import Dict, List, Tuple, Any, Iterable, Optional
+
+from kb import RULES, Rule
+from engine import PROTECTED_KEYS, differential_check, sort_rules
+from symptoms import exhaustive_symptoms, input_keys
+
+
+# stands for any value no partition of a key was built for
+_OTHER = object()
+
+
+def discriminator_stats(rules: List[Rule]) -> Dict[str, Dict[str, Any]]:
+    # rules testing each key against a hashable value, how they spread over
+    # values, and how many of them a request is expected to skip if the key
+    # partitions them (each request drawn like the rules' own values)
+    counts: Dict[str, Dict[Any, int]] = {}
+    for rule in rules:
+        for key, value in rule.get("if", {}).items():
+            try:
+                by_value = counts.setdefault(key, {})
+                by_value[value] = by_value.get(value, 0) + 1
+            except TypeError:
+                continue
+
+    stats = {}
+    for key, by_value in counts.items():
+        tested = sum(by_value.values())
+        stats[key] = {
+            "rules": tested,
+            "values": len(by_value),
+            "largest": max(by_value.values()),
+            "expected_skipped": tested - sum(count * count for count in by_value.values()) / tested,
+        }
+    return stats
+
+
+def choose_discriminators(rules: List[Rule], min_saving: float = 0.05) -> List[str]:
+    # greedy: take the key that skips the most of the still unpartitioned
+    # rules, as long as it skips at least min_saving of the whole KB
+    remaining = list(rules)
+    chosen: List[str] = []
+    while remaining:
+        stats = discriminator_stats(remaining)
+        candidates = [key for key in stats if key not in chosen]
+        if not candidates:
+            break
+        best = max(candidates, key=lambda key: stats[key]["expected_skipped"])
+        if stats[best]["expected_skipped"] < min_saving * len(rules):
+            break
+        chosen.append(best)
+        remaining = [rule for rule in remaining if best not in rule.get("if", {})]
+    return chosen
+
+
+class PartitionedEngine:
+    """Forward chaining that only visits the partitions a request can match.
+
+    Each rule is filed under the first discriminator key it tests (keys are
+    picked from condition statistics unless given), by the value it requires;
+    rules testing none of them are shared.  A pass walks the shared rules plus
+    the partition for the value each discriminator currently has, in rule
+    order.  Partitions on input keys are merged once per combination of
+    values; partitions on derived keys (e.g. ``cause``) are looked up again at
+    every step, so a value set mid-pass switches partitions from that point
+    on.  Rules in any other partition cannot match when they would be
+    visited, so results equal ``engine.forward_chain``.
+    """
+
+    def __init__(self, rules: List[Rule] = RULES, keys: Optional[Iterable[str]] = None, min_saving: float = 0.05) -> None:
+        self.rules = sort_rules(rules)
+        self.names = [rule.get("name", "<unnamed>") for rule in self.rules]
+        self.keys = choose_discriminators(self.rules, min_saving) if keys is None else list(keys)
+
+        self.shared: List[int] = []
+        self.partitions: Dict[str, Dict[Any, List[int]]] = {key: {} for key in self.keys}
+        for index, rule in enumerate(self.rules):
+            conditions = rule.get("if", {})
+            for key in self.keys:
+                if key not in conditions:
+                    continue
+                try:
+                    self.partitions[key].setdefault(conditions[key], []).append(index)
+                    break
+                except TypeError:
+                    continue
+            else:
+                self.shared.append(index)
+
+        inputs = set(input_keys(self.rules))
+        self.static_keys = [key for key in self.keys if key in inputs]
+        self.dynamic_keys = [key for key in self.keys if key not in inputs]
+        # every partition of a key, for values that cannot be looked up
+        self._all = {key: sorted(index for members in self.partitions[key].values() for index in members) for key in self.keys}
+        self._merged: Dict[Tuple[Any, ...], List[int]] = {}
+
+    def _members(self, key: str, value: Any) -> List[int]:
+        try:
+            return self.partitions[key].get(value, [])
+        except TypeError:
+            return self._all[key]
+
+    def _static(self, facts: Dict[str, Any]) -> List[int]:
+        try:
+            signature: Optional[Tuple[Any, ...]] = tuple(
+                facts.get(key) if facts.get(key) in self.partitions[key] else _OTHER
+                for key in self.static_keys
+            )
+        except TypeError:
+            signature = None
+        merged = self._merged.get(signature) if signature is not None else None
+        if merged is None:
+            merged = list(merge(self.shared, *(self._members(key, facts.get(key)) for key in self.static_keys)))
+            if signature is not None:
+                self._merged[signature] = merged
+        return merged
+
+    def run(self, facts: Dict[str, Any]) -> Tuple[Dict[str, Any], List[str], int]:
+        # like forward_chain, also returning how many rules had their
+        # conditions tested
+        static = self._static(facts)
+        dynamic_keys = self.dynamic_keys
+        fired: List[str] = []
+        fired_names = set()
+        evaluations = 0
+        changed = True
+
+        while changed:
+            changed = False
+            position = 0
+            cursor = -1
+
+            while True:
+                if dynamic_keys:
+                    while position < len(static) and static[position] <= cursor:
+                        position += 1
+                    index = static[position] if position < len(static) else None
+                    for key in dynamic_keys:
+                        members = self._members(key, facts.get(key))
+                        found = bisect_right(members, cursor)
+                        if found < len(members) and (index is None or members[found] < index):
+                            index = members[found]
+                    if index is None:
+                        break
+                else:
+                    if position == len(static):
+                        break
+                    index = static[position]
+                    position += 1
+                cursor = index
+
+                name = self.names[index]
+                if name in fired_names:
+                    continue
+                evaluations += 1
+                rule = self.rules[index]
+                if all(facts.get(key) == value for key, value in rule.get("if", {}).items()):
+                    for key, value in rule.get("then", {}).items():
+                        # Do not overwrite protected keys once set
+                        if key in PROTECTED_KEYS and key in facts and facts.get(key) != value:
+                            continue
+                        if facts.get(key) != value:
+                            facts[key] = value
+                            changed = True
+                    fired.append(name)
+                    fired_names.add(name)
+
+        return facts, fired, evaluations
+
+    def forward_chain(self, facts: Dict[str, Any]) -> Tuple[Dict[str, Any], List[str]]:
+        facts, fired, _ = self.run(facts)
+        return facts, fired
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "rules": len(self.rules),
+            "shared": len(self.shared),
+            "discriminators": {
+                key: {
+                    "partitions": len(self.partitions[key]),
+                    "rules": len(self._all[key]),
+                    "largest": max((len(members) for members in self.partitions[key].values()), default=0),
+                    "input": key in self.static_keys,
+                }
+                for key in self.keys
+            },
+        }
+
+
+def benchmark(rules: List[Rule] = RULES, inputs: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+    # per-request rule evaluations and time, unpartitioned vs partitioned
+    inputs = list(exhaustive_symptoms(rules)) if inputs is None else inputs
+    report: Dict[str, Any] = {"requests": len(inputs)}
+    for label, engine in (("before", PartitionedEngine(rules, keys=())), ("after", PartitionedEngine(rules))):
+        counts = []
+        start = time.perf_counter()
+        for facts in inputs:
+            counts.append(engine.run(dict(facts))[2])
+        elapsed = time.perf_counter() - start
+        report[label] = {
+            "discriminators": engine.keys,
+            "mean_evaluations": sum(counts) / max(len(counts), 1),
+            "max_evaluations": max(counts, default=0),
+            "us_per_request": elapsed / max(len(inputs), 1) * 1e6,
+        }
+    return report
+
+
+if __name__ == "__main__":
+    engine = PartitionedEngine()
+    stats = engine.stats()
+    print(f"{stats['rules']} rules, {stats['shared']} shared")
+    for key, info in stats["discriminators"].items():
+        kind = "input" if info["input"] else "derived"
+        print(f"  {key} ({kind}): {info['rules']} rules in {info['partitions']} partitions, largest {info['largest']}")
+
+    if "--verify" in sys.argv[1:]:
+        mismatches = differential_check(engine.forward_chain, RULES, exhaustive_symptoms(RULES))
+        print(f"{len(mismatches)} mismatches")
+    if "--bench" in sys.argv[1:]:
+        report = benchmark()
+        print(f"{report['requests']} requests")
+        for label in ("before", "after"):
+            row = report[label]
+            print(
+                f"  {label}: {row['mean_evaluations']:.1f} rule evaluations per request "
+                f"(max {row['max_evaluations']}), {row['us_per_request']:.1f} us"
+            )
@@ -0,0 +1,190 @@
+import argparse
+import sys
+import time
+from typing import Dict, List, Tuple, Any, Iterator, NamedTuple, Optional
+
+from kb import RULES, Rule
+from engine import sort_rules
+from frozen import FrozenKB
+
+
+class Candidate(NamedTuple):
+    rule: str
+    cause: Any
+    category: Any
+    diagnosis: Any
+    satisfied: int
+    total: int
+    score: float
+    # conditions on keys the facts do not have yet
+    missing: Dict[str, Any]
+    # key -> (required value, actual value), only with include_conflicting
+    conflicting: Dict[str, Tuple[Any, Any]]
+
+
+def _bits(mask: int) -> Iterator[int]:
+    # set bit positions, lowest first
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+class PartialMatcher:
+    """Ranks the rules concluding ``goal`` by the share of conditions facts satisfy.
+
+    Bit ``i`` of every bitset stands for the ``i``-th such rule in engine
+    order.  Each distinct condition ``key == value`` has the bitset of the
+    rules requiring it, and each key the bitset of rules testing it at all.
+    Scoring a request ORs/ANDs one bitset per known fact and adds them into
+    bit-sliced counters (one int per bit of the count), so the whole KB is
+    scored with a few dozen big-integer operations regardless of its size;
+    only the top-k winners are looked at individually.
+    """
+
+    def __init__(self, rules: List[Rule] = RULES, goal: str = "cause") -> None:
+        self.goal = goal
+        self.engine = FrozenKB(rules)
+        self.rules = [rule for rule in sort_rules(rules) if goal in rule.get("then", {})]
+        self.all = (1 << len(self.rules)) - 1
+
+        self.condition_rules: Dict[str, Dict[Any, int]] = {}
+        self.key_rules: Dict[str, int] = {}
+        # rules by number of conditions
+        self.by_total: Dict[int, int] = {}
+        for position, rule in enumerate(self.rules):
+            bit = 1 << position
+            conditions = rule.get("if", {})
+            self.by_total[len(conditions)] = self.by_total.get(len(conditions), 0) | bit
+            for key, value in conditions.items():
+                self.key_rules[key] = self.key_rules.get(key, 0) | bit
+                by_value = self.condition_rules.setdefault(key, {})
+                try:
+                    by_value[value] = by_value.get(value, 0) | bit
+                except TypeError:
+                    pass
+
+    def _score(self, facts: Dict[str, Any]) -> Tuple[List[int], int]:
+        counters: List[int] = []
+        conflicts = 0
+        for key, value in facts.items():
+            tested = self.key_rules.get(key)
+            if tested is None:
+                continue
+            try:
+                satisfied = self.condition_rules[key].get(value, 0)
+            except TypeError:
+                satisfied = 0
+            conflicts |= tested & ~satisfied
+
+            # ripple-carry add of one bit per rule
+            carry = satisfied
+            for level in range(len(counters)):
+                if not carry:
+                    break
+                counters[level], carry = counters[level] ^ carry, counters[level] & carry
+            if carry:
+                counters.append(carry)
+        return counters, conflicts
+
+    def _equal(self, counters: List[int], count: int) -> int:
+        if count >> len(counters):
+            return 0
+        mask = self.all
+        for level, plane in enumerate(counters):
+            mask &= plane if count >> level & 1 else ~plane
+        return mask
+
+    def rank(
+        self,
+        facts: Dict[str, Any],
+        k: int = 5,
+        min_satisfied: int = 1,
+        include_conflicting: bool = False,
+        derive: bool = True,
+    ) -> List[Candidate]:
+        # with derive, facts are first completed by forward chaining so that
+        # derived conditions (e.g. operation) count as satisfied
+        if derive:
+            facts = self.engine.run(facts)[0].to_dict()
+        counters, conflicts = self._score(facts)
+        eligible = self.all if include_conflicting else self.all & ~conflicts
+
+        groups = [
+            (satisfied, total)
+            for total in self.by_total
+            for satisfied in range(max(min_satisfied, 0), total + 1)
+            if total
+        ]
+        groups.sort(key=lambda group: (-group[0] / group[1], -group[0]))
+
+        winners: List[Tuple[int, int, int]] = []
+        for satisfied, total in groups:
+            members = self._equal(counters, satisfied) & self.by_total[total] & eligible
+            for position in _bits(members):
+                winners.append((satisfied, total, position))
+                if len(winners) == k:
+                    break
+            if len(winners) == k:
+                break
+
+        candidates = []
+        for satisfied, total, position in winners:
+            rule = self.rules[position]
+            then = rule.get("then", {})
+            missing, conflicting = {}, {}
+            for key, value in rule.get("if", {}).items():
+                if key not in facts:
+                    missing[key] = value
+                elif facts[key] != value:
+                    conflicting[key] = (value, facts[key])
+            candidates.append(Candidate(
+                rule=rule.get("name", "<unnamed>"),
+                cause=then.get(self.goal),
+                category=then.get("category"),
+                diagnosis=then.get("diagnosis"),
+                satisfied=satisfied,
+                total=total,
+                score=satisfied / total,
+                missing=missing,
+                conflicting=conflicting,
+            ))
+        return candidates
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Rank candidate diagnoses by partial rule matches.")
+    parser.add_argument("facts", nargs="*", metavar="KEY=VALUE")
+    parser.add_argument("-k", type=int, default=5)
+    parser.add_argument("--conflicting", action="store_true", help="also rank rules contradicted by a fact")
+    parser.add_argument("--bench", type=int, metavar="RULES", help="time ranking on a synthetic KB with this many cause rules")
+    args = parser.parse_args(argv)
+
+    if args.bench:
+        import random
+        from benchmark import synthetic_kb
+        # one layer, so every rule concludes a cause and is ranked
+        matcher = PartialMatcher(synthetic_kb(args.bench, depth=1))
+        # values for the keys the cause rules test, so most rules score
+        rng = random.Random(0)
+        workload = [{key: rng.randrange(10) for key in matcher.key_rules} for _ in range(200)]
+        start = time.perf_counter()
+        for facts in workload:
+            matcher.rank(facts, args.k, derive=False)
+        elapsed = (time.perf_counter() - start) / len(workload)
+        print(f"{len(matcher.rules)} cause rules, {elapsed * 1e3:.2f} ms per ranking")
+        return 0
+
+    facts: Dict[str, Any] = {}
+    for assignment in args.facts:
+        key, _, raw = assignment.partition("=")
+        facts[key] = int(raw) if raw.isdigit() else raw
+    for candidate in PartialMatcher().rank(facts, args.k, include_conflicting=args.conflicting):
+        missing = ", ".join(f"{key}={value}" for key, value in candidate.missing.items())
+        print(f"{candidate.score:.2f} {candidate.satisfied}/{candidate.total} {candidate.rule}: {candidate.diagnosis}"
+              + (f" (needs {missing})" if missing else ""))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
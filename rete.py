@@ -0,0 +1,106 @@
+from typing import Dict, List, Tuple, Any, Iterable
+
+from kb import Rule
+from engine import PROTECTED_KEYS, sort_rules
+from agenda import Agenda
+
+
+def _alpha_lookup(nodes: Dict[Any, List[int]], value: Any) -> Iterable[int]:
+    # unhashable fact values can never equal a (hashable) condition value
+    try:
+        return nodes.get(value, ())
+    except TypeError:
+        return ()
+
+
+class ReteNetwork:
+    """Rules compiled once into shared alpha nodes and per-rule join counters.
+
+    Every distinct ``(key, value)`` test in the knowledge base becomes a single
+    alpha node listing the rules that use it.  Facts form one working memory
+    element, so the beta join of a rule reduces to a counter of satisfied alpha
+    tests; a rule is activated when its counter reaches its condition count.
+    Only fact deltas are propagated through the network.
+    """
+
+    def __init__(self, rules: List[Rule]) -> None:
+        self.rules = sort_rules(rules)
+        self.names: List[str] = [rule.get("name", "<unnamed>") for rule in self.rules]
+        self.sizes: List[int] = [len(rule.get("if", {})) for rule in self.rules]
+        self.actions: List[Tuple[Tuple[str, Any], ...]] = [
+            tuple(rule.get("then", {}).items()) for rule in self.rules
+        ]
+
+        # key -> value -> indexes of rules testing key == value
+        self.alpha: Dict[str, Dict[Any, List[int]]] = {}
+        for index, rule in enumerate(self.rules):
+            for key, value in rule.get("if", {}).items():
+                self.alpha.setdefault(key, {}).setdefault(value, []).append(index)
+
+    def tables(self) -> Dict[str, Any]:
+        # plain lists and dicts, e.g. to cache a compiled network on disk
+        return {"rules": self.rules, "names": self.names, "sizes": self.sizes, "actions": self.actions, "alpha": self.alpha}
+
+    @classmethod
+    def from_tables(cls, tables: Dict[str, Any]) -> "ReteNetwork":
+        network = cls.__new__(cls)
+        network.rules = tables["rules"]
+        network.names = tables["names"]
+        network.sizes = tables["sizes"]
+        network.actions = tables["actions"]
+        network.alpha = tables["alpha"]
+        return network
+
+    @property
+    def alpha_node_count(self) -> int:
+        return sum(len(nodes) for nodes in self.alpha.values())
+
+    def forward_chain(self, facts: Dict[str, Any]) -> Tuple[Dict[str, Any], List[str]]:
+        counts = [0] * len(self.rules)
+        for key, nodes in self.alpha.items():
+            for index in _alpha_lookup(nodes, facts.get(key)):
+                counts[index] += 1
+
+        fired: List[str] = []
+        fired_names = set()
+        agenda = Agenda(index for index, count in enumerate(counts) if count == self.sizes[index])
+
+        def propagate(key: str, old: Any, new: Any) -> None:
+            nodes = self.alpha.get(key)
+            if nodes is None:
+                return
+            for index in _alpha_lookup(nodes, old):
+                counts[index] -= 1
+            for index in _alpha_lookup(nodes, new):
+                counts[index] += 1
+                if counts[index] == self.sizes[index]:
+                    agenda.activate(index)
+
+        while True:
+            changed = False
+
+            while (index := agenda.pop()) is not None:
+                name = self.names[index]
+                if name in fired_names or counts[index] != self.sizes[index]:
+                    continue
+
+                for key, value in self.actions[index]:
+                    # Do not overwrite protected keys once set
+                    if key in PROTECTED_KEYS and key in facts and facts.get(key) != value:
+                        continue
+
+                    old = facts.get(key)
+                    if old != value:
+                        facts[key] = value
+                        changed = True
+                        propagate(key, old, value)
+
+                fired.append(name)
+                fired_names.add(name)
+
+            if not changed:
+                break
+
+            agenda.start_next_pass()
+
+        return facts, fired
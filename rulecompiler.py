@@ -0,0 +1,216 @@
+import argparse
+import ast
+import hashlib
+import importlib.util
+import os
+import sys
+import tempfile
+from typing import Dict, List, Set, Tuple, Any, Callable, Optional
+
+from kb import RULES, Rule
+from engine import PROTECTED_KEYS, differential_check, kb_hash, sort_rules
+from symptoms import exhaustive_symptoms, input_keys
+
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".rulecache")
+
+def _generator_hash() -> str:
+    # cached modules are only valid for the generator that wrote them
+    with open(os.path.abspath(__file__), "rb") as source:
+        return hashlib.sha256(source.read()).hexdigest()
+
+
+CompiledEngine = Callable[[Dict[str, Any]], Tuple[Dict[str, Any], List[str]]]
+
+
+def _literal(value: Any) -> str:
+    source = repr(value)
+    try:
+        if ast.literal_eval(source) == value and type(ast.literal_eval(source)) is type(value):
+            return source
+    except (ValueError, SyntaxError):
+        pass
+    raise ValueError(f"Cannot compile rule value {value!r}: it has no literal form")
+
+
+class _Generator:
+    def __init__(self, rules: List[Rule], max_depth: int, min_share: float) -> None:
+        self.rules = sort_rules(rules)
+        self.max_depth = max_depth
+        self.min_share = min_share
+        self.constant_keys = input_keys(self.rules)
+        self.functions: List[str] = []
+        self.tables: List[str] = []
+        self.count = 0
+
+    def _name(self, kind: str) -> str:
+        self.count += 1
+        return f"_{kind}_{self.count}"
+
+    def _pick_discriminator(self, rules: List[Rule], bound: Set[str]) -> Optional[str]:
+        best, best_share = None, 0.0
+        for key in self.constant_keys:
+            if key in bound:
+                continue
+            share = sum(1 for rule in rules if key in rule.get("if", {})) / max(len(rules), 1)
+            if share > best_share:
+                best, best_share = key, share
+        if best is None or best_share < self.min_share:
+            return None
+        return best
+
+    def node(self, rules: List[Rule], bound: Set[str], depth: int) -> str:
+        key = self._pick_discriminator(rules, bound) if depth < self.max_depth else None
+        if key is None:
+            return self.leaf(rules, bound)
+
+        values: Dict[Any, None] = {}
+        for rule in rules:
+            if key in rule.get("if", {}):
+                values[rule["if"][key]] = None
+
+        branches = []
+        for value in values:
+            subset = [rule for rule in rules if rule.get("if", {}).get(key, value) == value]
+            branches.append((value, self.node(subset, bound | {key}, depth + 1)))
+        default = self.node([rule for rule in rules if key not in rule.get("if", {})], bound | {key}, depth + 1)
+
+        name = self._name("node")
+        table = f"{name}_TABLE"
+        self.tables.append(
+            f"{table} = {{\n"
+            + "".join(f"    {_literal(value)}: {branch},\n" for value, branch in branches)
+            + "}\n"
+        )
+        self.functions.append(
+            f"def {name}(facts):\n"
+            f"    # dispatch on {key}\n"
+            f"    try:\n"
+            f"        branch = {table}.get(facts.get({_literal(key)}), {default})\n"
+            f"    except TypeError:\n"
+            f"        branch = {default}\n"
+            f"    return branch(facts)\n"
+        )
+        return name
+
+    def leaf(self, rules: List[Rule], bound: Set[str]) -> str:
+        name = self._name("leaf")
+        local_names = {key: f"_k{index}" for index, key in enumerate(self.constant_keys)}
+        used = [
+            key for key in self.constant_keys
+            if key not in bound and any(key in rule.get("if", {}) for rule in rules)
+        ]
+
+        lines = [
+            f"def {name}(facts):",
+            "    fired = []",
+            "    fired_names = set()",
+            "    get = facts.get",
+        ]
+        for key in used:
+            lines.append(f"    {local_names[key]} = get({_literal(key)})")
+        lines += ["    changed = True", "    while changed:", "        changed = False"]
+
+        for rule in rules:
+            rule_name = _literal(rule.get("name", "<unnamed>"))
+            tests = [f"{rule_name} not in fired_names"]
+            for key, value in rule.get("if", {}).items():
+                if key in bound:
+                    continue
+                subject = local_names[key] if key in local_names else f"get({_literal(key)})"
+                tests.append(f"{subject} == {_literal(value)}")
+
+            lines.append(f"        if {' and '.join(tests)}:")
+            for key, value in rule.get("then", {}).items():
+                if key in PROTECTED_KEYS:
+                    # a protected key is only ever written while still unset
+                    if value is not None:
+                        lines += [
+                            f"            if {_literal(key)} not in facts:",
+                            f"                facts[{_literal(key)}] = {_literal(value)}",
+                            "                changed = True",
+                        ]
+                else:
+                    lines += [
+                        f"            if get({_literal(key)}) != {_literal(value)}:",
+                        f"                facts[{_literal(key)}] = {_literal(value)}",
+                        "                changed = True",
+                    ]
+            lines += [
+                f"            fired.append({rule_name})",
+                f"            fired_names.add({rule_name})",
+            ]
+
+        lines.append("    return facts, fired")
+        self.functions.append("\n".join(lines) + "\n")
+        return name
+
+    def module(self, version: str, generator: str) -> str:
+        root = self.node(self.rules, set(), 0)
+        return (
+            f"# Generated by rulecompiler.py for knowledge base {version}. Do not edit.\n"
+            f"KB_HASH = {_literal(version)}\n"
+            f"GENERATOR_HASH = {_literal(generator)}\n\n\n"
+            + "\n\n".join(self.functions)
+            + "\n\n"
+            + "\n".join(self.tables)
+            + f"\nforward_chain = {root}\n"
+        )
+
+
+def generate_source(rules: List[Rule] = RULES, max_depth: int = 3, min_share: float = 0.5) -> str:
+    return _Generator(rules, max_depth, min_share).module(kb_hash(rules), _generator_hash())
+
+
+def _load(path: str, version: str, generator: str) -> CompiledEngine:
+    spec = importlib.util.spec_from_file_location(f"_compiled_kb_{version[:16]}_{generator[:8]}", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    if module.KB_HASH != version:
+        raise ValueError(f"{path} was generated for a different knowledge base")
+    if getattr(module, "GENERATOR_HASH", None) != generator:
+        raise ValueError(f"{path} was generated by a different rulecompiler")
+    return module.forward_chain
+
+
+def compile_rules(rules: List[Rule] = RULES, cache_dir: str = DEFAULT_CACHE_DIR) -> CompiledEngine:
+    version, generator = kb_hash(rules), _generator_hash()
+    path = os.path.join(cache_dir, f"kb_{version[:16]}_{generator[:8]}.py")
+    if not os.path.exists(path):
+        os.makedirs(cache_dir, exist_ok=True)
+        handle, temporary = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(handle, "w", encoding="utf-8") as output:
+                output.write(generate_source(rules))
+            # atomic, so concurrent compilers never load a half-written module
+            os.replace(temporary, path)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+    return _load(path, version, generator)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Compile the knowledge base into specialized Python code.")
+    parser.add_argument("command", choices=["show", "build", "verify"])
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR)
+    args = parser.parse_args(argv)
+
+    if args.command == "show":
+        sys.stdout.write(generate_source())
+        return 0
+
+    compiled = compile_rules(cache_dir=args.cache_dir)
+    if args.command == "build":
+        print(f"Compiled {len(RULES)} rules into {args.cache_dir}")
+        return 0
+
+    mismatches = differential_check(compiled, RULES, exhaustive_symptoms(RULES))
+    for mismatch in mismatches:
+        print(mismatch)
+    print(f"{len(mismatches)} mismatches")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,418 @@
+import argparse
+import asyncio
+import json
+import sys
+import time
+from collections import deque
+from typing import Deque, Dict, List, Tuple, Any, Callable, NamedTuple, Optional
+
+from kb import RULES, Rule
+from rete import ReteNetwork
+from loader import RuleFileError, compile_files
+from streaming import Summary, build_result, known_keywords, record_to_facts
+
+
+BatchDiagnoser = Callable[[List[Dict[str, Any]]], List[Tuple[Dict[str, Any], List[str]]]]
+
+REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+    500: "Internal Server Error",
+    503: "Service Unavailable",
+}
+
+
+class Overloaded(Exception):
+    pass
+
+
+class Response(NamedTuple):
+    status: int
+    body: bytes
+    content_type: str = "application/json"
+    headers: Tuple[Tuple[str, str], ...] = ()
+
+    def json(self) -> Any:
+        return json.loads(self.body)
+
+
+def json_response(status: int, payload: Any, headers: Tuple[Tuple[str, str], ...] = ()) -> Response:
+    return Response(status, json.dumps(payload).encode("utf-8"), "application/json", headers)
+
+
+def _percentile(ordered: List[float], share: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, max(0, int(round(share * len(ordered))) - 1))]
+
+
+class Metrics:
+    def __init__(self, window: int = 4096) -> None:
+        self.started = time.monotonic()
+        self.requests = 0
+        self.responses: Dict[int, int] = {}
+        self.diagnoses = 0
+        self.batches = 0
+        self.rejected = 0
+        self.errors = 0
+        # request latencies (seconds) of the most recent requests
+        self.latencies: Deque[float] = deque(maxlen=window)
+        self.summary = Summary()
+
+    def as_dict(self, pending: int) -> Dict[str, Any]:
+        uptime = time.monotonic() - self.started
+        ordered = sorted(self.latencies)
+        return {
+            "uptime_s": uptime,
+            "requests": self.requests,
+            "responses": {str(status): count for status, count in sorted(self.responses.items())},
+            "rejected": self.rejected,
+            "errors": self.errors,
+            "diagnoses": self.diagnoses,
+            "diagnoses_per_s": self.diagnoses / uptime if uptime else 0.0,
+            "batches": self.batches,
+            "mean_batch_size": self.diagnoses / self.batches if self.batches else 0.0,
+            "pending": pending,
+            "latency_ms": {
+                "p50": _percentile(ordered, 0.50) * 1e3,
+                "p99": _percentile(ordered, 0.99) * 1e3,
+                "max": (ordered[-1] if ordered else 0.0) * 1e3,
+            },
+            "summary": self.summary.as_dict(),
+        }
+
+
+class MicroBatcher:
+    """Coalesces diagnoses submitted concurrently into engine batches.
+
+    A batch is flushed once it holds ``max_batch_size`` fact dicts or
+    ``max_delay`` seconds after its first one arrived, whichever comes first,
+    and is diagnosed in a worker thread so the event loop keeps accepting
+    requests.  At most ``max_pending`` fact dicts may wait; ``submit`` raises
+    ``Overloaded`` beyond that instead of queueing without bound.
+    """
+
+    def __init__(
+        self,
+        diagnose_batch: BatchDiagnoser,
+        max_batch_size: int = 256,
+        max_delay: float = 0.002,
+        max_pending: int = 8192,
+        metrics: Optional[Metrics] = None,
+    ) -> None:
+        self.diagnose_batch = diagnose_batch
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self.max_pending = max_pending
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.pending = 0
+        self._queue: Optional["asyncio.Queue[Tuple[Dict[str, Any], asyncio.Future]]"] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._queue = asyncio.Queue()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def submit(self, batch: List[Dict[str, Any]]) -> List[Tuple[Dict[str, Any], List[str]]]:
+        if self.pending + len(batch) > self.max_pending:
+            raise Overloaded(f"{self.pending} diagnoses pending")
+        loop = asyncio.get_running_loop()
+        self.pending += len(batch)
+        futures = []
+        for facts in batch:
+            future = loop.create_future()
+            self._queue.put_nowait((facts, future))
+            futures.append(future)
+        return list(await asyncio.gather(*futures))
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            items = [await self._queue.get()]
+            deadline = loop.time() + self.max_delay
+            while len(items) < self.max_batch_size:
+                try:
+                    items.append(self._queue.get_nowait())
+                    continue
+                except asyncio.QueueEmpty:
+                    pass
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    items.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            try:
+                results = await loop.run_in_executor(None, self.diagnose_batch, [facts for facts, _ in items])
+            except Exception as error:
+                for _, future in items:
+                    if not future.done():
+                        future.set_exception(error)
+            else:
+                for (_, future), result in zip(items, results):
+                    if not future.done():
+                        future.set_result(result)
+            finally:
+                self.pending -= len(items)
+            self.metrics.batches += 1
+            self.metrics.diagnoses += len(items)
+
+
+def make_batch_diagnoser(rules: List[Rule] = RULES, numpy_threshold: int = 256) -> BatchDiagnoser:
+    # the NumPy engine only pays off for large batches; small ones go
+    # through the Rete network one by one
+    network = ReteNetwork(rules)
+    vectorized = None
+    try:
+        from batch import BatchEngine
+        vectorized = BatchEngine(rules)
+    except ImportError:
+        pass
+
+    def diagnose_batch(batch: List[Dict[str, Any]]) -> List[Tuple[Dict[str, Any], List[str]]]:
+        if vectorized is not None and len(batch) >= numpy_threshold:
+            return vectorized.forward_chain_batch(batch)
+        return [network.forward_chain(facts) for facts in batch]
+
+    return diagnose_batch
+
+
+class DiagnosisService:
+    """HTTP/JSON front end of the engine, independent of the transport.
+
+    ``POST /diagnose`` takes one record (the same fields ``streaming.py``
+    accepts) and ``POST /diagnose/batch`` a list of them or ``{"records":
+    [...]}``; ``GET /metrics`` and ``GET /healthz`` report on the service.
+    ``handle`` maps a request to a ``Response``, so tests can call it
+    directly through ``InProcessClient`` without opening a socket.
+    """
+
+    def __init__(
+        self,
+        rules: List[Rule] = RULES,
+        max_batch_size: int = 256,
+        max_delay: float = 0.002,
+        max_pending: int = 8192,
+        max_request_records: int = 1000,
+        max_body_bytes: int = 1 << 20,
+        diagnose_batch: Optional[BatchDiagnoser] = None,
+    ) -> None:
+        self.rules = rules
+        self.keywords = known_keywords(rules)
+        self.max_request_records = max_request_records
+        self.max_body_bytes = max_body_bytes
+        self.metrics = Metrics()
+        self.batcher = MicroBatcher(
+            diagnose_batch or make_batch_diagnoser(rules),
+            max_batch_size=max_batch_size,
+            max_delay=max_delay,
+            max_pending=max_pending,
+            metrics=self.metrics,
+        )
+
+    async def start(self) -> None:
+        await self.batcher.start()
+
+    async def stop(self) -> None:
+        await self.batcher.stop()
+
+    async def _diagnose(self, records: List[Any]) -> List[Dict[str, Any]]:
+        facts_list = [record_to_facts(record, self.keywords) for record in records]
+        outcomes = await self.batcher.submit([dict(facts) for facts in facts_list])
+        results = []
+        for record, facts, (final_facts, fired) in zip(records, facts_list, outcomes):
+            result = build_result(record, facts, final_facts, fired)
+            self.metrics.summary.add(result)
+            results.append(result)
+        return results
+
+    async def handle(self, method: str, path: str, body: bytes = b"") -> Response:
+        start = time.monotonic()
+        self.metrics.requests += 1
+        if len(body) > self.max_body_bytes:
+            return self._count(self._body_too_large(), start)
+        try:
+            response = await self._route(method, path.split("?", 1)[0], body)
+        except Overloaded as error:
+            self.metrics.rejected += 1
+            response = json_response(503, {"error": f"overloaded: {error}"}, (("Retry-After", "1"),))
+        except Exception as error:
+            # a bad record or a failing engine must still get an answer
+            self.metrics.errors += 1
+            response = json_response(500, {"error": f"internal error: {type(error).__name__}"})
+        return self._count(response, start)
+
+    def _count(self, response: Response, start: float) -> Response:
+        self.metrics.responses[response.status] = self.metrics.responses.get(response.status, 0) + 1
+        self.metrics.latencies.append(time.monotonic() - start)
+        return response
+
+    def _body_too_large(self) -> Response:
+        return json_response(413, {"error": f"request body over {self.max_body_bytes} bytes"})
+
+    async def _route(self, method: str, path: str, body: bytes) -> Response:
+        if path == "/healthz":
+            return json_response(200, {"status": "ok", "rules": len(self.rules)})
+        if path == "/metrics":
+            if method != "GET":
+                return json_response(405, {"error": "use GET"})
+            return json_response(200, self.metrics.as_dict(self.batcher.pending))
+        if path not in ("/diagnose", "/diagnose/batch"):
+            return json_response(404, {"error": f"no route for {path}"})
+        if method != "POST":
+            return json_response(405, {"error": "use POST"})
+
+        try:
+            payload = json.loads(body or b"null")
+        except ValueError:
+            return json_response(400, {"error": "body is not valid JSON"})
+
+        if path == "/diagnose":
+            if not isinstance(payload, dict):
+                return json_response(400, {"error": "expected a JSON object"})
+            return json_response(200, (await self._diagnose([payload]))[0])
+
+        if isinstance(payload, dict) and "records" in payload:
+            payload = payload["records"]
+        if not isinstance(payload, list) or not all(isinstance(record, dict) for record in payload):
+            return json_response(400, {"error": "expected a list of JSON objects"})
+        # a batch the queue can never hold would get 503 on every retry
+        limit = min(self.max_request_records, self.batcher.max_pending)
+        if len(payload) > limit:
+            return json_response(413, {"error": f"at most {limit} records per request"})
+        return json_response(200, {"results": await self._diagnose(payload)})
+
+    async def _serve_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                try:
+                    method, target, version = request_line.decode("latin-1").split()
+                except ValueError:
+                    break
+                headers: Dict[str, str] = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                length = int(headers.get("content-length", "0") or 0)
+                if length < 0:
+                    break
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                if length > self.max_body_bytes:
+                    # answer before reading the body; the connection cannot
+                    # be reused with it still unread
+                    self.metrics.requests += 1
+                    response = self._count(self._body_too_large(), time.monotonic())
+                    keep_alive = False
+                else:
+                    body = await reader.readexactly(length) if length else b""
+                    response = await self.handle(method.upper(), target, body)
+
+                head = [
+                    f"HTTP/1.1 {response.status} {REASONS.get(response.status, '')}",
+                    f"Content-Type: {response.content_type}",
+                    f"Content-Length: {len(response.body)}",
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}",
+                ]
+                head += [f"{name}: {value}" for name, value in response.headers]
+                writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + response.body)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host: str = "127.0.0.1", port: int = 8080) -> None:
+        await self.start()
+        server = await asyncio.start_server(self._serve_connection, host, port)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            await self.stop()
+
+
+class InProcessClient:
+    """Calls a ``DiagnosisService`` directly, for tests and local scripts.
+
+        async with InProcessClient(DiagnosisService()) as client:
+            response = await client.post("/diagnose", {"status": 404})
+    """
+
+    def __init__(self, service: DiagnosisService) -> None:
+        self.service = service
+
+    async def __aenter__(self) -> "InProcessClient":
+        await self.service.start()
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self.service.stop()
+
+    async def get(self, path: str) -> Response:
+        return await self.service.handle("GET", path)
+
+    async def post(self, path: str, payload: Any) -> Response:
+        return await self.service.handle("POST", path, json.dumps(payload).encode("utf-8"))
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Serve diagnoses over HTTP/JSON.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--rules", action="append", metavar="PATH",
+                        help="rule file or directory to use instead of kb.RULES (repeatable)")
+    parser.add_argument("--max-batch-size", type=int, default=256)
+    parser.add_argument("--max-delay-ms", type=float, default=2.0, help="latency budget for filling a batch")
+    parser.add_argument("--max-pending", type=int, default=8192, help="queued diagnoses before rejecting with 503")
+    parser.add_argument("--max-body-bytes", type=int, default=1 << 20, help="larger request bodies get 413 unread")
+    args = parser.parse_args(argv)
+
+    rules = RULES
+    if args.rules:
+        try:
+            rules = compile_files(args.rules).rules
+        except RuleFileError as error:
+            print(error, file=sys.stderr)
+            return 2
+
+    service = DiagnosisService(
+        rules,
+        max_batch_size=args.max_batch_size,
+        max_delay=args.max_delay_ms / 1e3,
+        max_pending=args.max_pending,
+        max_body_bytes=args.max_body_bytes,
+    )
+    print(f"Serving {len(rules)} rules on http://{args.host}:{args.port}", file=sys.stderr)
+    try:
+        asyncio.run(service.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
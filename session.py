@@ -0,0 +1,204 @@
+from typing import Dict, List, Set, Tuple, Any, Iterable, NamedTuple, Optional
+
+from kb import RULES, Rule
+from engine import PROTECTED_KEYS, sort_rules
+
+
+class Firing(NamedTuple):
+    pass_number: int
+    index: int
+    name: str
+    writes: Tuple[Tuple[str, Any], ...]
+
+
+class Session:
+    """Stateful triage session with incremental truth maintenance.
+
+    The user-provided facts are kept separately from what the rules derived,
+    and every firing is recorded with the pass and rule position it happened
+    at.  After ``assert_fact``, ``retract_fact`` or ``modify_fact`` only the
+    rules that read or write a key affected by the change (and can still
+    match at all) are re-simulated; the recorded firings of every other rule
+    are replayed at their original position.  Those rules neither see nor
+    touch an affected key, so their firings would come out the same in a full
+    rerun, which makes ``facts`` and ``fired`` identical to
+    ``engine.forward_chain`` on the current input facts.
+    """
+
+    def __init__(self, rules: List[Rule] = RULES, facts: Optional[Dict[str, Any]] = None) -> None:
+        self.rules = sort_rules(rules)
+        self.names = [rule.get("name", "<unnamed>") for rule in self.rules]
+        self.readers: Dict[str, List[int]] = {}
+        self.writers: Dict[str, List[int]] = {}
+        for index, rule in enumerate(self.rules):
+            for key in rule.get("if", {}):
+                self.readers.setdefault(key, []).append(index)
+            for key in rule.get("then", {}):
+                self.writers.setdefault(key, []).append(index)
+        # replaying firings of other rules relies on rules being told apart by name
+        self._exact = len(set(self.names)) == len(self.names)
+
+        self.base: Dict[str, Any] = dict(facts or {})
+        self.trace: List[Firing] = []
+        self.facts: Dict[str, Any] = {}
+        self.fired: List[str] = []
+        self.last_rechecked = 0
+        self._update(None)
+
+    def assert_fact(self, key: str, value: Any) -> None:
+        if key in self.base and self.base[key] == value:
+            return
+        self.base[key] = value
+        self._update({key})
+
+    def retract_fact(self, key: str) -> None:
+        if key not in self.base:
+            raise KeyError(key)
+        del self.base[key]
+        self._update({key})
+
+    def modify_fact(self, key: str, value: Any) -> None:
+        if key not in self.base:
+            raise KeyError(key)
+        self.assert_fact(key, value)
+
+    def justification(self, key: str) -> Optional[str]:
+        # name of the rule that produced the current value, None for inputs
+        for firing in reversed(self.trace):
+            if any(written == key for written, _ in firing.writes):
+                return firing.name
+        return None
+
+    def justifications(self) -> Dict[str, Optional[str]]:
+        return {key: self.justification(key) for key in self.facts}
+
+    def _affected(self, keys: Set[str]) -> Set[int]:
+        # a rule reading an affected key may change everything it writes, and
+        # a rule writing one competes with the rules producing it
+        affected_keys = set(keys)
+        affected: Set[int] = set()
+        frontier = list(keys)
+        while frontier:
+            key = frontier.pop()
+            for index in self.readers.get(key, []) + self.writers.get(key, []):
+                if index in affected:
+                    continue
+                affected.add(index)
+                for written in self.rules[index].get("then", {}):
+                    if written not in affected_keys:
+                        affected_keys.add(written)
+                        frontier.append(written)
+        return affected
+
+    def _live(self, indexes: Iterable[int], kept: List[Firing]) -> List[int]:
+        # least fixpoint of rules whose conditions can be met by values that
+        # are given, kept, or that some live rule can write; the others never fire
+        possible: Dict[str, Set[Any]] = {}
+        for firing in kept:
+            for key, value in firing.writes:
+                try:
+                    possible.setdefault(key, set()).add(value)
+                except TypeError:
+                    pass
+        candidates = set(indexes)
+        live: Set[int] = set()
+
+        def can_hold(key: str, value: Any) -> bool:
+            if key in self.base:
+                if self.base[key] == value:
+                    return True
+            elif value is None:
+                return True
+            return value in possible.get(key, ())
+
+        progress = True
+        while progress:
+            progress = False
+            for index in sorted(candidates - live):
+                rule = self.rules[index]
+                try:
+                    satisfiable = all(can_hold(key, value) for key, value in rule.get("if", {}).items())
+                except TypeError:
+                    satisfiable = True
+                if satisfiable:
+                    live.add(index)
+                    progress = True
+                    for key, value in rule.get("then", {}).items():
+                        try:
+                            possible.setdefault(key, set()).add(value)
+                        except TypeError:
+                            pass
+        return sorted(live)
+
+    def _simulate(self, kept: List[Firing], candidates: List[int]) -> List[Firing]:
+        facts = dict(self.base)
+        kept_by_pass: Dict[int, List[Firing]] = {}
+        for firing in kept:
+            kept_by_pass.setdefault(firing.pass_number, []).append(firing)
+        fired_names = {firing.name for firing in kept}
+        fired: List[Firing] = []
+
+        def replay(firing: Firing) -> bool:
+            for key, value in firing.writes:
+                facts[key] = value
+            return bool(firing.writes)
+
+        pass_number = 0
+        changed = True
+        while changed:
+            pass_number += 1
+            changed = False
+            events = iter(kept_by_pass.get(pass_number, ()))
+            event = next(events, None)
+
+            for index in candidates:
+                while event is not None and event.index < index:
+                    changed |= replay(event)
+                    event = next(events, None)
+
+                name = self.names[index]
+                if name in fired_names:
+                    continue
+                rule = self.rules[index]
+                if not all(facts.get(key) == value for key, value in rule.get("if", {}).items()):
+                    continue
+
+                writes = []
+                for key, value in rule.get("then", {}).items():
+                    # Do not overwrite protected keys once set
+                    if key in PROTECTED_KEYS and key in facts and facts.get(key) != value:
+                        continue
+                    if facts.get(key) != value:
+                        facts[key] = value
+                        writes.append((key, value))
+                fired.append(Firing(pass_number, index, name, tuple(writes)))
+                fired_names.add(name)
+                changed |= bool(writes)
+
+            while event is not None:
+                changed |= replay(event)
+                event = next(events, None)
+
+        return fired
+
+    def _update(self, changed_keys: Optional[Set[str]]) -> None:
+        if changed_keys is None or not self._exact:
+            affected = set(range(len(self.rules)))
+        else:
+            affected = self._affected(changed_keys)
+
+        kept = [firing for firing in self.trace if firing.index not in affected]
+        candidates = self._live(affected, kept)
+        self.last_rechecked = len(candidates)
+        self.trace = sorted(kept + self._simulate(kept, candidates))
+
+        # rebuild in firing order so keys come out in forward_chain's order
+        facts = dict(self.base)
+        for firing in self.trace:
+            for key, value in firing.writes:
+                facts[key] = value
+        self.facts = facts
+        self.fired = [firing.name for firing in self.trace]
+
+    def result(self) -> Tuple[Dict[str, Any], List[str]]:
+        return dict(self.facts), list(self.fired)
@@ -0,0 +1,213 @@
+import sys
+from typing import Dict, List, Set, Tuple, Any, NamedTuple
+
+from kb import RULES, Rule
+from engine import PROTECTED_KEYS, forward_chain, sort_rules
+from symptoms import exhaustive_symptoms
+
+
+class CycleError(ValueError):
+    def __init__(self, cycles: List[List[str]]) -> None:
+        self.cycles = cycles
+        described = "; ".join("{" + ", ".join(cycle) + "}" for cycle in cycles)
+        super().__init__(f"Knowledge base has cyclic rule dependencies: {described}")
+
+
+class Stratum(NamedTuple):
+    index: int
+    rules: List[str]
+    reads: List[str]
+    writes: List[str]
+    cyclic: bool
+
+
+def _strongly_connected(successors: List[List[int]]) -> List[List[int]]:
+    # iterative Tarjan; components come out sinks first
+    index_of: List[int] = [-1] * len(successors)
+    low: List[int] = [0] * len(successors)
+    on_stack: List[bool] = [False] * len(successors)
+    stack: List[int] = []
+    components: List[List[int]] = []
+    counter = 0
+
+    for root in range(len(successors)):
+        if index_of[root] != -1:
+            continue
+        work: List[Tuple[int, int]] = [(root, 0)]
+        while work:
+            node, edge = work.pop()
+            if edge == 0:
+                index_of[node] = low[node] = counter
+                counter += 1
+                stack.append(node)
+                on_stack[node] = True
+            if edge < len(successors[node]):
+                work.append((node, edge + 1))
+                successor = successors[node][edge]
+                if index_of[successor] == -1:
+                    work.append((successor, 0))
+                elif on_stack[successor]:
+                    low[node] = min(low[node], index_of[successor])
+                continue
+            if work:
+                parent = work[-1][0]
+                low[parent] = min(low[parent], low[node])
+            if low[node] == index_of[node]:
+                component = []
+                while True:
+                    member = stack.pop()
+                    on_stack[member] = False
+                    component.append(member)
+                    if member == node:
+                        break
+                components.append(component)
+    return components
+
+
+class StratifiedEngine:
+    """Runs rules once each, in topological order of their key dependencies.
+
+    A rule depends on every rule writing a key it reads.  Rules are layered
+    into strata so that each stratum only reads keys finished by earlier
+    strata and is evaluated in a single pass, in engine order, so competing
+    writers of a protected key in one stratum keep first-writer-wins.  Rules
+    on a dependency cycle raise ``CycleError`` unless ``strict`` is False, in
+    which case they are iterated to a fixpoint.
+
+    Writers of one protected key that land in different strata are ordered
+    by stratum rather than by engine order, so a rule reading a derived
+    fact (e.g. ``operation``) runs after generic rules on inputs alone, as it
+    effectively does in ``engine.forward_chain``.  Results can still differ
+    from it on other KBs; see ``differences``.
+    """
+
+    def __init__(self, rules: List[Rule], strict: bool = True) -> None:
+        self.rules = sort_rules(rules)
+        self.names = [rule.get("name", "<unnamed>") for rule in self.rules]
+        count = len(self.rules)
+
+        keys: Dict[str, int] = {}
+        for rule in self.rules:
+            for part in ("if", "then"):
+                for key in rule.get(part, {}):
+                    keys.setdefault(key, count + len(keys))
+
+        # bipartite graph: rule -> key it writes -> rule reading that key
+        successors: List[List[int]] = [[] for _ in range(count + len(keys))]
+        for index, rule in enumerate(self.rules):
+            successors[index].extend(keys[key] for key in rule.get("then", {}))
+            for key in rule.get("if", {}):
+                successors[keys[key]].append(index)
+
+        components = _strongly_connected(successors)
+        cyclic = [component for component in components if len(component) > 1]
+        key_names = {node: key for key, node in keys.items()}
+        if cyclic and strict:
+            raise CycleError([
+                sorted(key_names[node] if node in key_names else self.names[node] for node in component)
+                for component in cyclic
+            ])
+
+        # longest path over rule nodes, visiting components sources first; a
+        # key is finished once every rule writing it has run
+        depth = [0] * len(successors)
+        level: Dict[int, int] = {}
+        for component in reversed(components):
+            members = set(component)
+            rule_nodes = [node for node in component if node < count]
+            current = max(depth[node] for node in component)
+            for node in rule_nodes:
+                level[node] = current
+            step = 1 if rule_nodes else 0
+            for node in component:
+                for successor in successors[node]:
+                    if successor not in members:
+                        depth[successor] = max(depth[successor], current + step)
+
+        self._units: List[List[Tuple[List[int], bool]]] = []
+        component_of = {node: number for number, component in enumerate(cyclic) for node in component}
+        layers: Dict[int, List[int]] = {}
+        for index, stratum in level.items():
+            layers.setdefault(stratum, []).append(index)
+
+        self.strata: List[Stratum] = []
+        for stratum in sorted(layers):
+            members = sorted(layers[stratum])
+            acyclic: List[int] = []
+            recursive: Dict[int, List[int]] = {}
+            for index in members:
+                if index in component_of:
+                    recursive.setdefault(component_of[index], []).append(index)
+                else:
+                    acyclic.append(index)
+
+            units: List[Tuple[List[int], bool]] = []
+            if acyclic:
+                units.append((acyclic, False))
+            for indexes in recursive.values():
+                units.append((indexes, True))
+            self._units.append(units)
+            self.strata.append(Stratum(
+                index=len(self.strata),
+                rules=[self.names[index] for index in members],
+                reads=sorted({key for index in members for key in self.rules[index].get("if", {})}),
+                writes=sorted({key for index in members for key in self.rules[index].get("then", {})}),
+                cyclic=bool(recursive),
+            ))
+
+    def _run(self, indexes: List[int], facts: Dict[str, Any], fired: List[str], fired_names: Set[str]) -> bool:
+        changed = False
+        for index in indexes:
+            name = self.names[index]
+            if name in fired_names:
+                continue
+
+            rule = self.rules[index]
+            if all(facts.get(key) == value for key, value in rule.get("if", {}).items()):
+                for key, value in rule.get("then", {}).items():
+                    # Do not overwrite protected keys once set
+                    if key in PROTECTED_KEYS and key in facts and facts.get(key) != value:
+                        continue
+                    if facts.get(key) != value:
+                        facts[key] = value
+                        changed = True
+                fired.append(name)
+                fired_names.add(name)
+        return changed
+
+    def forward_chain(self, facts: Dict[str, Any]) -> Tuple[Dict[str, Any], List[str]]:
+        fired: List[str] = []
+        fired_names: Set[str] = set()
+        for units in self._units:
+            for indexes, recursive in units:
+                while self._run(indexes, facts, fired, fired_names) and recursive:
+                    pass
+        return facts, fired
+
+
+def differences(rules: List[Rule] = RULES) -> List[Dict[str, Any]]:
+    engine = StratifiedEngine(rules)
+    found = []
+    for facts in exhaustive_symptoms(rules):
+        expected, _ = forward_chain(dict(facts), rules)
+        actual, _ = engine.forward_chain(dict(facts))
+        if actual != expected:
+            changed = {
+                key: (expected.get(key), actual.get(key))
+                for key in set(expected) | set(actual)
+                if expected.get(key) != actual.get(key)
+            }
+            found.append({"facts": facts, "changed": changed})
+    return found
+
+
+if __name__ == "__main__":
+    for stratum in StratifiedEngine(RULES).strata:
+        print(f"Stratum {stratum.index}{' (cyclic)' if stratum.cyclic else ''}: {len(stratum.rules)} rules")
+        print(f"  reads:  {', '.join(stratum.reads)}")
+        print(f"  writes: {', '.join(stratum.writes)}")
+    if "--diff" in sys.argv[1:]:
+        found = differences()
+        for difference in found:
+            print(difference)
+        print(f"{len(found)} inputs diagnosed differently from forward_chain")
@@ -0,0 +1,287 @@
+import argparse
+import json
+import re
+import sys
+from collections import Counter, deque
+from contextlib import ExitStack
+from functools import partial
+from typing import Deque, Dict, List, Tuple, Any, Callable, Iterable, Iterator, Optional, TextIO
+
+from kb import RULES, Rule
+from rete import ReteNetwork
+from loader import RuleFileError, compile_files
+from parallel import ParallelDiagnoser
+
+
+EngineMap = Callable[[Iterable[Dict[str, Any]]], Iterable[Tuple[Dict[str, Any], List[str]]]]
+
+# status code -> error keywords rules test for it; None for rules without one
+KeywordIndex = Dict[Optional[int], List[str]]
+
+# record field -> fact key, first match wins
+FIELD_ALIASES: Dict[str, List[str]] = {
+    "status_code": ["status_code", "status", "http_status", "response_status"],
+    "method": ["method", "http_method", "request_method", "verb"],
+    "error_keyword": ["error_keyword", "keyword"],
+    "client_type": ["client_type", "client"],
+    "has_auth_header": ["has_auth_header", "auth_header"],
+}
+
+# free-text fields searched for a known error keyword when none is given
+MESSAGE_FIELDS = ["error", "error_message", "message", "msg"]
+
+# copied from the input record so diagnoses can be correlated downstream
+PASSTHROUGH_FIELDS = ["timestamp", "time", "endpoint", "path", "request_id"]
+
+ACCESS_LOG_PATTERN = re.compile(
+    r'^(?P<host>\S+) \S+ (?P<user>\S+) \[(?P<time>[^\]]+)\] '
+    r'"(?P<method>[A-Z]+) (?P<path>\S+)[^"]*" (?P<status>\d{3}) \S+'
+    r'(?: "(?P<referer>[^"]*)" "(?P<agent>[^"]*)")?'
+)
+
+RESULT_KEYS = ["category", "cause", "diagnosis", "recommendation"]
+
+
+def known_keywords(rules: List[Rule]) -> KeywordIndex:
+    by_status: Dict[Optional[int], set] = {}
+    for rule in rules:
+        conditions = rule.get("if", {})
+        if isinstance(conditions.get("error_keyword"), str):
+            by_status.setdefault(conditions.get("status_code"), set()).add(conditions["error_keyword"])
+    # longest first so "db_connection" wins over any shorter keyword it contains
+    return {
+        status: sorted(keywords, key=lambda keyword: (-len(keyword), keyword))
+        for status, keywords in by_status.items()
+    }
+
+
+def _words(text: str) -> str:
+    # "DB-connection refused" -> " db connection refused ", so keywords match
+    # whole words only and "db_connection" matches however it is spelled
+    return " " + " ".join(re.findall(r"[a-z0-9]+", text.lower())) + " "
+
+
+def _yes_no(value: Any) -> Optional[str]:
+    if isinstance(value, bool):
+        return "yes" if value else "no"
+    if isinstance(value, str) and value.lower() in ("yes", "no", "true", "false"):
+        return "yes" if value.lower() in ("yes", "true") else "no"
+    return None
+
+
+def record_to_facts(record: Dict[str, Any], keywords: KeywordIndex) -> Dict[str, Any]:
+    facts: Dict[str, Any] = {}
+
+    for key, aliases in FIELD_ALIASES.items():
+        for alias in aliases:
+            value = record.get(alias)
+            if value not in (None, ""):
+                facts[key] = value
+                break
+
+    if "status_code" in facts:
+        status = facts["status_code"]
+        try:
+            # 404.5, inf and nan are not status codes
+            if isinstance(status, float) and not status.is_integer():
+                raise ValueError(status)
+            facts["status_code"] = int(status)
+        except (TypeError, ValueError, OverflowError):
+            del facts["status_code"]
+
+    if isinstance(facts.get("method"), str):
+        facts["method"] = facts["method"].upper()
+
+    if "has_auth_header" in facts:
+        answer = _yes_no(facts["has_auth_header"])
+        if answer is None:
+            del facts["has_auth_header"]
+        else:
+            facts["has_auth_header"] = answer
+    elif isinstance(record.get("headers"), dict):
+        headers = {name.lower() for name in record["headers"]}
+        facts["has_auth_header"] = "yes" if "authorization" in headers else "no"
+
+    # only keywords some rule tests for this status code can matter
+    status = facts.get("status_code")
+    candidates = (keywords.get(status, []) if status is not None else []) + keywords.get(None, [])
+    if "error_keyword" not in facts and candidates:
+        for field in MESSAGE_FIELDS:
+            message = record.get(field)
+            if not isinstance(message, str):
+                continue
+            message = _words(message)
+            keyword = next((keyword for keyword in candidates if f" {keyword.replace('_', ' ')} " in message), None)
+            if keyword is not None:
+                facts["error_keyword"] = keyword
+                break
+
+    return facts
+
+
+def parse_access_log_line(line: str) -> Optional[Dict[str, Any]]:
+    match = ACCESS_LOG_PATTERN.match(line)
+    if match is None:
+        return None
+    return {
+        "method": match.group("method"),
+        "path": match.group("path"),
+        "status": match.group("status"),
+        "time": match.group("time"),
+    }
+
+
+def read_records(lines: Iterable[str], fmt: str = "jsonl") -> Iterator[Tuple[int, Optional[Dict[str, Any]]]]:
+    for number, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line:
+            continue
+
+        if fmt == "access":
+            yield number, parse_access_log_line(line)
+            continue
+
+        try:
+            record = json.loads(line)
+        except ValueError:
+            record = None
+        yield number, record if isinstance(record, dict) else None
+
+
+class Summary:
+    def __init__(self) -> None:
+        self.records = 0
+        self.invalid = 0
+        self.undiagnosed = 0
+        self.causes: Counter = Counter()
+        self.categories: Counter = Counter()
+
+    def add(self, result: Dict[str, Any]) -> None:
+        self.records += 1
+        if result.get("cause") is None:
+            self.undiagnosed += 1
+            return
+        self.causes[result["cause"]] += 1
+        self.categories[result.get("category")] += 1
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "records": self.records,
+            "invalid": self.invalid,
+            "undiagnosed": self.undiagnosed,
+            "causes": dict(self.causes.most_common()),
+            "categories": {str(name): count for name, count in self.categories.most_common()},
+        }
+
+
+def build_result(
+    record: Dict[str, Any],
+    facts: Dict[str, Any],
+    final_facts: Dict[str, Any],
+    fired: List[str],
+) -> Dict[str, Any]:
+    result: Dict[str, Any] = {}
+    for field in PASSTHROUGH_FIELDS:
+        if field in record:
+            result[field] = record[field]
+    result["facts"] = facts
+    for key in RESULT_KEYS:
+        result[key] = final_facts.get(key)
+    result["fired"] = fired
+    return result
+
+
+def diagnose_records(
+    records: Iterable[Tuple[int, Optional[Dict[str, Any]]]],
+    engine_map: EngineMap,
+    summary: Summary,
+    keywords: KeywordIndex,
+) -> Iterator[Dict[str, Any]]:
+    # records whose facts were handed to engine_map but not yet diagnosed;
+    # engine_map reads ahead by a bounded amount, so this stays small
+    pending: Deque[Tuple[int, Dict[str, Any], Dict[str, Any]]] = deque()
+
+    def facts_stream() -> Iterator[Dict[str, Any]]:
+        for number, record in records:
+            if record is None:
+                summary.invalid += 1
+                continue
+            facts = record_to_facts(record, keywords)
+            pending.append((number, record, facts))
+            yield dict(facts)
+
+    for final_facts, fired in engine_map(facts_stream()):
+        number, record, facts = pending.popleft()
+        result: Dict[str, Any] = {"line": number}
+        result.update(build_result(record, facts, final_facts, fired))
+        summary.add(result)
+        yield result
+
+
+def run(
+    source: TextIO,
+    sink: TextIO,
+    fmt: str = "jsonl",
+    rules: List[Rule] = RULES,
+    summary_every: int = 0,
+    summary_sink: TextIO = sys.stderr,
+    workers: int = 1,
+    chunk_size: int = 256,
+) -> Summary:
+    summary = Summary()
+
+    with ExitStack() as stack:
+        if workers > 1:
+            engine_map: EngineMap = stack.enter_context(ParallelDiagnoser(rules, workers, chunk_size)).map
+        else:
+            network = ReteNetwork(rules)
+            engine_map = partial(map, network.forward_chain)
+
+        results = diagnose_records(read_records(source, fmt), engine_map, summary, known_keywords(rules))
+        for result in results:
+            sink.write(json.dumps(result) + "\n")
+            if summary_every and summary.records % summary_every == 0:
+                summary_sink.write(json.dumps(summary.as_dict()) + "\n")
+                summary_sink.flush()
+
+    summary_sink.write(json.dumps(summary.as_dict()) + "\n")
+    summary_sink.flush()
+    return summary
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Diagnose failed API calls from a JSONL or access-log stream.")
+    parser.add_argument("input", nargs="?", default="-", help="input file, '-' for stdin (default)")
+    parser.add_argument("-o", "--output", default="-", help="output JSONL file, '-' for stdout (default)")
+    parser.add_argument("-f", "--format", choices=["jsonl", "access"], default="jsonl")
+    parser.add_argument("--summary-every", type=int, default=0, metavar="N",
+                        help="also write the running summary to stderr every N records")
+    parser.add_argument("-j", "--workers", type=int, default=1, help="worker processes (default 1)")
+    parser.add_argument("--chunk-size", type=int, default=256, help="records per worker task (default 256)")
+    parser.add_argument("--rules", action="append", metavar="PATH",
+                        help="rule file or directory to use instead of kb.RULES (repeatable)")
+    args = parser.parse_args(argv)
+
+    rules = RULES
+    if args.rules:
+        try:
+            rules = compile_files(args.rules).rules
+        except RuleFileError as error:
+            print(error, file=sys.stderr)
+            return 2
+
+    source = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+    sink = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    try:
+        run(source, sink, args.format, rules=rules, summary_every=args.summary_every,
+            workers=args.workers, chunk_size=args.chunk_size)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if sink is not sys.stdout:
+            sink.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
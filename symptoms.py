@@ -0,0 +1,89 @@
+import itertools
+from typing import Dict, List, Any, Iterator, Optional
+
+from kb import Rule
+
+
+KEYWORDS_BY_STATUS: Dict[int, list[str]] = {
+    400: ["", "json", "missing_field", "type", "validation", "empty", "size", "query"],
+    401: ["", "expired", "malformed", "signature", "revoked", "api_key", "scheme"],
+    403: ["", "role", "scope", "policy", "ip"],
+    404: ["", "version", "resource", "slash", "deprecated"],
+    500: ["", "null", "config", "timeout", "db_connection", "memory"],
+    503: ["", "circuit"],
+}
+
+STATUS_OPTIONS = [None, 400, 401, 403, 404, 405, 415, 429, 500, 502, 503, 504]
+
+RELEVANT_METHOD_BY_STATUS_CODES: Dict[int, list[str]] = {
+    400: ["", "GET", "POST", "PUT", "PATCH", "DELETE"],
+    403: ["", "GET", "POST", "PUT", "PATCH", "DELETE"],
+    404: ["", "GET", "POST", "PUT", "PATCH", "DELETE"],
+    405: ["", "GET", "POST", "PUT", "PATCH", "DELETE"],
+    415: ["", "POST", "PUT", "PATCH"],
+    429: ["", "GET", "POST", "PUT", "PATCH", "DELETE"],
+}
+
+AUTH_HEADER_OPTIONS = ["yes", "no"]
+AUTH_HEADER_STATUS_CODES = (401,)
+
+CLIENT_TYPE_OPTIONS = ["public_api", "internal_service"]
+CLIENT_TYPE_STATUS_CODES = (403, 429)
+
+
+def enumerate_symptoms() -> Iterator[Dict[str, Any]]:
+    # every fact dict the symptom form can produce, built in the same key order
+    for status_code in STATUS_OPTIONS:
+        if status_code is None:
+            continue
+
+        auth_options: list[Optional[str]] = [None]
+        if status_code in AUTH_HEADER_STATUS_CODES:
+            auth_options = list(AUTH_HEADER_OPTIONS)
+        client_options: list[Optional[str]] = [None]
+        if status_code in CLIENT_TYPE_STATUS_CODES:
+            client_options = list(CLIENT_TYPE_OPTIONS)
+        keyword_options = KEYWORDS_BY_STATUS.get(status_code, [""])
+        method_options = RELEVANT_METHOD_BY_STATUS_CODES.get(status_code, [""])
+
+        for has_auth_header in auth_options:
+            for client_type in client_options:
+                for error_keyword in keyword_options:
+                    for method in method_options:
+                        facts: Dict[str, Any] = {"status_code": status_code}
+                        if has_auth_header is not None:
+                            facts["has_auth_header"] = has_auth_header
+                        if client_type is not None:
+                            facts["client_type"] = client_type
+                        if error_keyword:
+                            facts["error_keyword"] = error_keyword
+                        if method:
+                            facts["method"] = method
+                        yield facts
+
+
+def input_keys(rules: List[Rule]) -> List[str]:
+    # keys rules test but never set, i.e. the ones only the caller can provide
+    written = {key for rule in rules for key in rule.get("then", {})}
+    keys: Dict[str, None] = {}
+    for rule in rules:
+        for key in rule.get("if", {}):
+            if key not in written:
+                keys[key] = None
+    return list(keys)
+
+
+def exhaustive_symptoms(rules: List[Rule]) -> Iterator[Dict[str, Any]]:
+    # every combination of tested values (or absence) of the input keys; any
+    # other value behaves like an absent key since no condition can equal it
+    domains: List[List[Any]] = []
+    keys = input_keys(rules)
+    for key in keys:
+        values: Dict[Any, None] = {}
+        for rule in rules:
+            if key in rule.get("if", {}):
+                values[rule["if"][key]] = None
+        domains.append([None] + [value for value in values if value is not None])
+
+    for combination in itertools.product(*domains):
+        yield {key: value for key, value in zip(keys, combination) if value is not None}